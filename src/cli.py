@@ -0,0 +1,175 @@
+"""股票数据工具命令行入口
+
+用法:
+    python src/cli.py init-db
+    python src/cli.py crawl [--force]
+    python src/cli.py backfill AAPL MSFT --period 1y [--target sp500]
+    python src/cli.py export prices.parquet --tickers AAPL MSFT --start 2025-01-01
+    python src/cli.py stats
+
+yfinance、pandas 等重量级依赖只在 crawl / backfill 实际抓取时才会导入，
+init-db 和 stats 可以即时启动。
+"""
+import os
+import sys
+import sqlite3
+import logging
+import argparse
+
+import new
+from query import read_only_uri
+
+logger = logging.getLogger('stock_crawler')
+
+TARGETS = {
+    'priority': ("重点", lambda: new.PRIORITY_DB_PATH),
+    'sp500': ("标普500", lambda: new.SP500_DB_PATH),
+}
+
+
+def cmd_init_db(args):
+    """初始化两个数据库的表结构和索引"""
+    new.init_sp500_database()
+    new.init_priority_database()
+    return 0
+
+
+def cmd_crawl(args):
+    """抓取数据：默认只抓取过期的股票，--force 时抓取全部股票"""
+    new.init_sp500_database()
+    new.init_priority_database()
+    if not args.force:
+        results = new.crawl_stale_assets()
+    else:
+        results = {
+            "重点": new.fetch_all_assets_in_batches(new.PRIORITY_TICKERS, "重点", new.PRIORITY_DB_PATH),
+            "标普500": new.fetch_all_assets_in_batches(new.load_sp500_tickers(), "标普500", new.SP500_DB_PATH),
+        }
+    return 1 if any(failed for _, failed in results.values()) else 0
+
+
+def cmd_backfill(args):
+    """为指定股票补抓更长时间范围的历史数据"""
+    batch_name, db_path = TARGETS[args.target]
+    if args.target == 'sp500':
+        new.init_sp500_database()
+    else:
+        new.init_priority_database()
+    _, failed = new.fetch_all_assets_in_batches(
+        [ticker.upper() for ticker in args.tickers],
+        f"{batch_name}补数",
+        db_path(),
+        period=args.period
+    )
+    return 1 if failed else 0
+
+
+def cmd_export(args):
+    """流式导出价格历史，支持按股票和日期过滤及断点续传"""
+    from export import export_price_history
+
+    _, db_path = TARGETS[args.target]
+    export_price_history(
+        db_path(),
+        args.output,
+        fmt=args.format,
+        tickers=args.tickers,
+        start_date=args.start,
+        end_date=args.end,
+        chunk_size=args.chunk_size,
+        state_path=args.state
+    )
+    return 0
+
+
+def database_stats(db_path):
+    """统计数据库中的股票数、价格记录数和日期范围"""
+    connection = sqlite3.connect(read_only_uri(db_path), uri=True)
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SELECT COUNT(*) FROM Assets")
+        assets = cursor.fetchone()[0]
+        cursor.execute("SELECT COUNT(*), MIN(date), MAX(date) FROM PriceHistory")
+        rows, first_date, last_date = cursor.fetchone()
+        return {'assets': assets, 'rows': rows, 'first_date': first_date, 'last_date': last_date}
+    finally:
+        connection.close()
+
+
+def cmd_stats(args):
+    """输出各数据库的数据概况及过期股票数量"""
+    from scheduler import expected_latest_bar, latest_stored_dates
+
+    expected = expected_latest_bar().isoformat()
+    print(f"预期最新交易日: {expected}")
+    for batch_name, db_path in TARGETS.values():
+        path = db_path()
+        if not os.path.exists(path):
+            print(f"{batch_name}: {path}（不存在）")
+            continue
+        try:
+            stats = database_stats(path)
+        except sqlite3.OperationalError as e:
+            print(f"{batch_name}: {path}（无法读取: {e}）")
+            continue
+        stale = sum(1 for last in latest_stored_dates(path).values() if last is None or last < expected)
+        print(
+            f"{batch_name}: {path}\n"
+            f"  股票数: {stats['assets']}，价格记录: {stats['rows']}，"
+            f"日期范围: {stats['first_date']} ~ {stats['last_date']}，过期股票: {stale}"
+        )
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='cli.py', description="股票数据爬取与管理工具")
+    parser.add_argument('-v', '--verbose', action='store_true', help="输出 DEBUG 级别日志")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    p = subparsers.add_parser('init-db', help="初始化数据库表结构")
+    p.set_defaults(func=cmd_init_db)
+
+    p = subparsers.add_parser('crawl', help="抓取过期的股票数据（重点股票优先）")
+    p.add_argument('--force', action='store_true', help="忽略交易日历，抓取全部股票")
+    p.set_defaults(func=cmd_crawl)
+
+    p = subparsers.add_parser('backfill', help="补抓指定股票的历史数据")
+    p.add_argument('tickers', nargs='+', help="股票代码")
+    p.add_argument('--period', default='1y', help="yfinance 时间范围，如 6mo、1y、5y、max（默认 1y）")
+    p.add_argument('--target', choices=sorted(TARGETS), default='priority', help="写入的数据库（默认 priority）")
+    p.set_defaults(func=cmd_backfill)
+
+    p = subparsers.add_parser('export', help="流式导出价格历史到 CSV / JSON Lines / Parquet")
+    p.add_argument('output', help="输出文件路径，'-' 表示标准输出")
+    p.add_argument('--format', choices=['csv', 'jsonl', 'parquet'], help="导出格式（默认按扩展名推断）")
+    p.add_argument('--tickers', nargs='+', help="只导出指定股票")
+    p.add_argument('--start', help="起始日期（含），YYYY-MM-DD")
+    p.add_argument('--end', help="结束日期（含），YYYY-MM-DD")
+    p.add_argument('--state', help="断点续传状态文件，用于每日增量导出")
+    p.add_argument('--chunk-size', type=int, default=10000, help="每次从游标读取的记录数（默认 10000）")
+    p.add_argument('--target', choices=sorted(TARGETS), default='priority', help="导出的数据库（默认 priority）")
+    p.set_defaults(func=cmd_export)
+
+    p = subparsers.add_parser('stats', help="查看数据库概况")
+    p.set_defaults(func=cmd_stats, quiet=True)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if getattr(args, 'quiet', False):
+        return args.func(args)
+
+    logging_session = new.setup_logging(level=logging.DEBUG if args.verbose else logging.INFO)
+    try:
+        return args.func(args)
+    except Exception as e:
+        logger.critical(f"程序运行出错: {e}", exc_info=True)
+        return 1
+    finally:
+        logging_session.stop()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
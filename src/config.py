@@ -0,0 +1,9 @@
+import os
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+# 数据库配置（所有模块统一从这里读取，避免各自解析环境变量导致不一致）
+SP500_DB_PATH = os.getenv('SP500_DB_PATH', 'finance_portfolio_sp500.db')
+PRIORITY_DB_PATH = os.getenv('PRIORITY_DB_PATH', 'finance_portfolio_priority.db')
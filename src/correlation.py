@@ -0,0 +1,276 @@
+import sqlite3
+import logging
+import numpy as np
+from config import SP500_DB_PATH
+
+logger = logging.getLogger(__name__)
+
+# 默认的指数加权衰减系数（RiskMetrics 日频取 0.94）
+DEFAULT_EWMA_LAMBDA = 0.94
+
+# refresh() 重新读取的最近交易日数，覆盖爬虫每次重新写入的 30 天价格
+REFRESH_LOOKBACK_DAYS = 30
+
+
+def _forward_fill(closes):
+    """按列向前填充收盘价矩阵中的缺失值（NaN）"""
+    valid = ~np.isnan(closes)
+    idx = np.where(valid, np.arange(closes.shape[0])[:, None], 0)
+    np.maximum.accumulate(idx, axis=0, out=idx)
+    return closes[idx, np.arange(closes.shape[1])]
+
+
+def _to_returns(closes):
+    """由原始收盘价矩阵计算日收益；缺失数据（上市前或停牌）按零收益处理"""
+    filled = _forward_fill(closes)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = filled[1:] / filled[:-1] - 1.0
+    returns[~np.isfinite(returns)] = 0.0
+    return returns, filled[-1].copy()
+
+
+def _cov_to_corr(cov):
+    """由协方差矩阵计算相关系数矩阵，零方差资产对应 NaN"""
+    std = np.sqrt(np.diag(cov))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        corr = cov / np.outer(std, std)
+    corr[std == 0, :] = np.nan
+    corr[:, std == 0] = np.nan
+    return corr
+
+
+def _freeze(matrix):
+    """将缓存结果设为只读，防止调用方修改缓存"""
+    matrix.setflags(write=False)
+    return matrix
+
+
+class _WindowState:
+    """滚动窗口的增量统计量：收益之和与外积之和"""
+
+    def __init__(self, window, returns):
+        block = returns[-window:]
+        self.window = window
+        self.sum = block.sum(axis=0)
+        self.sum_outer = block.T @ block
+
+    def update(self, new_row, dropped_row):
+        """追加一行收益并移出窗口最早的一行（秩一更新）"""
+        self.sum += new_row - dropped_row
+        self.sum_outer += np.outer(new_row, new_row) - np.outer(dropped_row, dropped_row)
+
+    def covariance(self):
+        n = self.window
+        mean = self.sum / n
+        return (self.sum_outer - n * np.outer(mean, mean)) / (n - 1)
+
+
+class _EwmaState:
+    """指数加权协方差的递推状态（零均值，RiskMetrics 方法）"""
+
+    def __init__(self, lam, returns):
+        self.lam = lam
+        weights = (1 - lam) * lam ** np.arange(returns.shape[0] - 1, -1, -1)
+        self.cov = (returns * weights[:, None]).T @ returns
+
+    def update(self, new_row):
+        self.cov *= self.lam
+        self.cov += (1 - self.lam) * np.outer(new_row, new_row)
+
+
+class CorrelationEngine:
+    """标普500成分股的协方差/相关系数计算引擎
+
+    从 PriceHistory 一次性构建按日期对齐的收益矩阵（行：交易日，列：股票），
+    之后每追加一个交易日只做增量更新。计算结果按 (类型, 窗口, 最新日期) 缓存。
+    同时保留原始收盘价矩阵，以便 refresh() 发现已有日期的价格被补齐或修正时重建受影响的行。
+    """
+
+    def __init__(self, db_path=SP500_DB_PATH, ewma_lambda=DEFAULT_EWMA_LAMBDA):
+        self.db_path = db_path
+        self.ewma_lambda = ewma_lambda
+        self.tickers = []
+        self.dates = []
+        self.returns = np.empty((0, 0))
+        self._all_dates = []
+        self._closes = np.empty((0, 0))
+        self._ticker_index = {}
+        self._last_close = np.empty(0)
+        self._windows = {}
+        self._ewma = {}
+        self._cache = {}
+
+    @property
+    def last_date(self):
+        return self.dates[-1] if self.dates else None
+
+    def _load_rows(self, since=None):
+        """读取 (ticker, date, close) 记录（指定 since 时只读取该日期及之后），按日期排序"""
+        connection = sqlite3.connect(self.db_path)
+        try:
+            sql = """
+                SELECT a.ticker_symbol, p.date, p.close_price
+                FROM PriceHistory p
+                JOIN Assets a ON a.asset_id = p.asset_id
+                WHERE p.close_price IS NOT NULL
+            """
+            params = ()
+            if since is not None:
+                sql += " AND p.date >= ?"
+                params = (since,)
+            sql += " ORDER BY p.date"
+            return connection.execute(sql, params).fetchall()
+        finally:
+            connection.close()
+
+    def load(self):
+        """从数据库构建完整的对齐收益矩阵，并清空所有缓存和增量状态"""
+        rows = self._load_rows()
+        tickers = sorted({row[0] for row in rows})
+        dates = sorted({row[1] for row in rows})
+        ticker_index = {t: i for i, t in enumerate(tickers)}
+        date_index = {d: i for i, d in enumerate(dates)}
+
+        closes = np.full((len(dates), len(tickers)), np.nan)
+        if rows:
+            r = np.fromiter((date_index[row[1]] for row in rows), dtype=np.intp, count=len(rows))
+            c = np.fromiter((ticker_index[row[0]] for row in rows), dtype=np.intp, count=len(rows))
+            closes[r, c] = np.fromiter((row[2] for row in rows), dtype=float, count=len(rows))
+
+        self.tickers = tickers
+        self._ticker_index = ticker_index
+        self._all_dates = dates
+        self._closes = closes
+        self._rebuild()
+        logger.info(f"收益矩阵构建完成: {len(self.dates)} 个交易日 x {len(self.tickers)} 只股票")
+        return self
+
+    def _rebuild(self):
+        """由原始收盘价矩阵重新计算收益矩阵，并清空所有缓存和增量状态"""
+        if self._all_dates:
+            self.returns, self._last_close = _to_returns(self._closes)
+        else:
+            self.returns, self._last_close = np.empty((0, len(self.tickers))), np.empty(0)
+        self.dates = self._all_dates[1:]
+        self._windows.clear()
+        self._ewma.clear()
+        self._cache.clear()
+
+    def _close_row(self, closes):
+        """将 dict: ticker -> close 转为按股票池排列的一行原始收盘价（缺失为 NaN）"""
+        row = np.full(len(self.tickers), np.nan)
+        for ticker, close in closes.items():
+            i = self._ticker_index.get(ticker)
+            if i is not None and close is not None:
+                row[i] = close
+        return row
+
+    def append_day(self, date, closes):
+        """追加一个交易日的收盘价（dict: ticker -> close），增量更新所有已计算的统计量
+
+        不在当前股票池中的代码会被忽略；股票池变化后需要重新调用 load()。
+        """
+        if not self._ticker_index:
+            raise RuntimeError("收益矩阵尚未构建，请先调用 load()")
+        if self._all_dates and date <= self._all_dates[-1]:
+            raise ValueError(f"日期 {date} 不晚于当前最新日期 {self._all_dates[-1]}")
+
+        raw = self._close_row(closes)
+        new_close = np.where(np.isnan(raw), self._last_close, raw)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            new_row = new_close / self._last_close - 1.0
+        new_row[~np.isfinite(new_row)] = 0.0
+
+        for state in self._windows.values():
+            state.update(new_row, self.returns[-state.window])
+        for state in self._ewma.values():
+            state.update(new_row)
+
+        self.returns = np.vstack([self.returns, new_row])
+        self._closes = np.vstack([self._closes, raw])
+        self._all_dates.append(date)
+        self.dates = self._all_dates[1:]
+        self._last_close = new_close
+        self._cache.clear()
+
+    def refresh(self, lookback=REFRESH_LOOKBACK_DAYS):
+        """从数据库同步最近 lookback 个交易日及之后的新交易日，返回追加或修正的天数
+
+        爬取过程中读取到的日期可能只有部分股票的价格，之后补齐的价格或爬虫重新写入的
+        修正价格都落在已有日期上。这些日期的原始收盘价有变化时重建收益矩阵（增量状态在
+        下次计算时重新初始化）；只有新交易日时按日增量追加。
+        """
+        if not self._ticker_index:
+            self.load()
+            return len(self.dates)
+
+        start = max(0, len(self._all_dates) - lookback)
+        by_date = {}
+        for ticker, date, close in self._load_rows(since=self._all_dates[start]):
+            by_date.setdefault(date, {})[ticker] = close
+
+        restated = 0
+        for i in range(start, len(self._all_dates)):
+            row = self._close_row(by_date.get(self._all_dates[i], {}))
+            if not np.array_equal(row, self._closes[i], equal_nan=True):
+                self._closes[i] = row
+                restated += 1
+
+        new_dates = sorted(d for d in by_date if d > self._all_dates[-1])
+        if restated:
+            rows = [self._close_row(by_date[d]) for d in new_dates]
+            if rows:
+                self._closes = np.vstack([self._closes] + rows)
+            self._all_dates.extend(new_dates)
+            self._rebuild()
+            logger.info(f"{restated} 个已有交易日的价格发生变化，收益矩阵已重建")
+        else:
+            for date in new_dates:
+                self.append_day(date, by_date[date])
+        return restated + len(new_dates)
+
+    def _cached(self, key, compute):
+        key = key + (self.last_date,)
+        result = self._cache.get(key)
+        if result is None:
+            result = _freeze(compute())
+            self._cache[key] = result
+        return result
+
+    def _window_state(self, window):
+        if window < 2 or window > len(self.dates):
+            raise ValueError(f"窗口长度必须在 2 到 {len(self.dates)} 之间: {window}")
+        state = self._windows.get(window)
+        if state is None:
+            state = _WindowState(window, self.returns)
+            self._windows[window] = state
+        return state
+
+    def _ewma_state(self, lam):
+        if not 0 < lam < 1:
+            raise ValueError(f"衰减系数必须在 (0, 1) 之间: {lam}")
+        if not self.dates:
+            raise ValueError("收益矩阵为空")
+        state = self._ewma.get(lam)
+        if state is None:
+            state = _EwmaState(lam, self.returns)
+            self._ewma[lam] = state
+        return state
+
+    def covariance(self, window):
+        """最近 window 个交易日的样本协方差矩阵"""
+        return self._cached(('cov', window), lambda: self._window_state(window).covariance())
+
+    def correlation(self, window):
+        """最近 window 个交易日的相关系数矩阵"""
+        return self._cached(('corr', window), lambda: _cov_to_corr(self.covariance(window)))
+
+    def ewma_covariance(self, lam=None):
+        """指数加权协方差矩阵"""
+        lam = self.ewma_lambda if lam is None else lam
+        return self._cached(('ewma_cov', lam), lambda: self._ewma_state(lam).cov.copy())
+
+    def ewma_correlation(self, lam=None):
+        """指数加权相关系数矩阵"""
+        lam = self.ewma_lambda if lam is None else lam
+        return self._cached(('ewma_corr', lam), lambda: _cov_to_corr(self.ewma_covariance(lam)))
@@ -0,0 +1,179 @@
+import os
+import csv
+import sys
+import json
+import sqlite3
+import logging
+from query import read_only_uri
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ('csv', 'jsonl', 'parquet')
+
+EXPORT_COLUMNS = [
+    'history_id', 'date', 'asset_id', 'ticker_symbol', 'name', 'currency',
+    'open_price', 'high_price', 'low_price', 'close_price', 'volume'
+]
+
+# 按 history_id 顺序读取（主键即 rowid，无需排序）。history_id 为 AUTOINCREMENT，
+# 且爬虫只对新增或数值变化的记录执行 INSERT OR REPLACE（分配新的 history_id），
+# 重抓到的相同记录保持原 history_id 不变，因此它只随真正的数据变化单调递增：
+# 断点续传时从上次导出的最大 history_id 之后继续，晚到的和被修正的记录都不会遗漏
+EXPORT_SQL = """
+    SELECT p.history_id, p.date, p.asset_id, a.ticker_symbol, a.name, a.currency,
+           p.open_price, p.high_price, p.low_price, p.close_price, p.volume
+    FROM PriceHistory p
+    JOIN Assets a ON a.asset_id = p.asset_id
+    WHERE p.history_id > ?
+      AND p.date BETWEEN ? AND ?
+      AND (? IS NULL OR a.ticker_symbol IN (SELECT value FROM json_each(?)))
+    ORDER BY p.history_id
+"""
+
+
+def _load_state(state_path):
+    """读取上次导出的最大 history_id"""
+    if not state_path or not os.path.exists(state_path):
+        return 0
+    with open(state_path) as f:
+        state = json.load(f)
+    if 'history_id' not in state:
+        raise ValueError(f"无法识别的导出状态文件（旧版按日期记录的进度），请删除后重新全量导出: {state_path}")
+    return state['history_id']
+
+
+def _save_state(state_path, history_id):
+    """原子地保存导出进度，避免中途失败留下损坏的状态文件"""
+    tmp_path = state_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'history_id': history_id}, f)
+    os.replace(tmp_path, state_path)
+
+
+class _CsvSink:
+    def __init__(self, stream):
+        self.writer = csv.writer(stream)
+        self.writer.writerow(EXPORT_COLUMNS)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        pass
+
+
+class _JsonLinesSink:
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, rows):
+        self.stream.writelines(
+            json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False) + '\n'
+            for row in rows
+        )
+
+    def close(self):
+        pass
+
+
+class _ParquetSink:
+    """每个数据块写为一个 Parquet 行组"""
+
+    def __init__(self, path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.schema = pa.schema([
+            ('history_id', pa.int64()),
+            ('date', pa.string()),
+            ('asset_id', pa.int64()),
+            ('ticker_symbol', pa.string()),
+            ('name', pa.string()),
+            ('currency', pa.string()),
+            ('open_price', pa.float64()),
+            ('high_price', pa.float64()),
+            ('low_price', pa.float64()),
+            ('close_price', pa.float64()),
+            ('volume', pa.int64()),
+        ])
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def write(self, rows):
+        columns = list(zip(*rows))
+        self.writer.write_table(self.pa.Table.from_arrays(
+            [self.pa.array(column, type=field.type) for column, field in zip(columns, self.schema)],
+            schema=self.schema
+        ))
+
+    def close(self):
+        self.writer.close()
+
+
+def _open_sink(output, fmt):
+    """打开输出目标，返回 (sink, 需要关闭的文件对象)；output 为 '-' 时写到标准输出"""
+    if fmt == 'parquet':
+        if output == '-':
+            raise ValueError("Parquet 格式不支持输出到标准输出")
+        return _ParquetSink(output), None
+
+    stream = sys.stdout if output == '-' else open(output, 'w', newline='', encoding='utf-8')
+    sink = _CsvSink(stream) if fmt == 'csv' else _JsonLinesSink(stream)
+    return sink, (None if output == '-' else stream)
+
+
+def infer_format(output):
+    """根据输出文件扩展名推断导出格式，无法推断时默认为 CSV"""
+    ext = os.path.splitext(output)[1].lower().lstrip('.')
+    if ext in ('jsonl', 'ndjson'):
+        return 'jsonl'
+    if ext in ('parquet', 'pq'):
+        return 'parquet'
+    return 'csv'
+
+
+def export_price_history(db_path, output, fmt=None, tickers=None, start_date=None, end_date=None,
+                         chunk_size=10000, state_path=None):
+    """流式导出 PriceHistory（关联 Assets）到 CSV / JSON Lines / Parquet
+
+    按 chunk_size 分块从游标读取并立即写出，内存占用与表大小无关。记录按写入顺序（history_id）导出。
+    指定 state_path 时只导出上次导出之后写入的记录（包括晚到的和被修正的旧日期记录），
+    并在导出成功后更新该文件，用于每日增量导出。
+    注意：被修正的记录会以新的 history_id 再次导出，增量文件中可能出现与之前重复的
+    (date, asset_id)，使用方应按 history_id 保留最新的一条。
+
+    返回本次导出的记录数。
+    """
+    fmt = fmt or infer_format(output)
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"不支持的导出格式: {fmt}")
+    if chunk_size <= 0:
+        raise ValueError(f"chunk_size 必须为正数: {chunk_size}")
+
+    last_id = _load_state(state_path)
+    ticker_json = json.dumps([t.upper() for t in tickers]) if tickers else None
+    params = (last_id, str(start_date or '0000-01-01'), str(end_date or '9999-12-31'), ticker_json, ticker_json)
+
+    connection = sqlite3.connect(read_only_uri(db_path), uri=True)
+    stream = None
+    exported = 0
+    try:
+        sink, stream = _open_sink(output, fmt)
+        cursor = connection.execute(EXPORT_SQL, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            sink.write(rows)
+            exported += len(rows)
+            last_id = rows[-1][0]
+        sink.close()
+    finally:
+        if stream is not None:
+            stream.close()
+        connection.close()
+
+    if state_path and exported:
+        _save_state(state_path, last_id)
+    logger.info(f"已导出 {exported} 条价格记录到 {output}（{fmt}）" + (f"，最后 history_id {last_id}" if exported else ""))
+    return exported
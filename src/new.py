@@ -1,39 +1,77 @@
 import os
-import yfinance as yf
-import pandas as pd
 import sqlite3
-from dotenv import load_dotenv
 from datetime import datetime
 import time
 import logging
-from retry import retry
-
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    filename='stock_crawler.log'
-)
-console = logging.StreamHandler()
-console.setLevel(logging.INFO)
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-console.setFormatter(formatter)
-logging.getLogger('').addHandler(console)
-
-# 加载环境变量
-load_dotenv()
-
-# 数据库配置
-SP500_DB_PATH = os.getenv('SP500_DB_PATH', 'finance_portfolio_sp500.db')
-PRIORITY_DB_PATH = os.getenv('PRIORITY_DB_PATH', 'finance_portfolio_priority.db')
+import logging.handlers
+import queue
+import threading
+from config import SP500_DB_PATH, PRIORITY_DB_PATH
+from query import create_query_indexes
+from portfolio import init_portfolio_tables, on_prices_updated
+from scheduler import plan_crawl, expected_latest_bar, init_crawl_status_table, record_crawl_attempts
+# yfinance、pandas 和 retry 导入耗时较长，不在模块顶部导入，只在真正抓取数据的函数内部导入
+
+logger = logging.getLogger('stock_crawler')
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+class LoggingSession:
+    """setup_logging 返回的句柄：stop() 写出剩余日志，并撤销对根日志记录器所做的修改"""
+
+    def __init__(self, listener, queue_handler, file_handler, previous_level):
+        self.listener = listener
+        self.queue_handler = queue_handler
+        self.file_handler = file_handler
+        self.previous_level = previous_level
+        self._stopped = False
+
+    def stop(self):
+        if self._stopped:
+            return
+        self._stopped = True
+        # 先摘除 QueueHandler，之后的日志不会再进入无人消费的队列
+        root = logging.getLogger()
+        root.removeHandler(self.queue_handler)
+        root.setLevel(self.previous_level)
+        self.listener.stop()
+        self.file_handler.close()
+
+def setup_logging(log_file='stock_crawler.log', level=logging.INFO):
+    """配置基于队列的异步日志：业务线程只把记录放入队列，由后台线程写文件和控制台
+
+    返回 LoggingSession，程序退出前需调用其 stop() 以写出剩余日志并移除添加的 handler。
+    """
+    formatter = logging.Formatter(LOG_FORMAT)
+    file_handler = logging.FileHandler(log_file, encoding='utf-8')
+    file_handler.setFormatter(formatter)
+    console = logging.StreamHandler()
+    console.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    root = logging.getLogger()
+    previous_level = root.level
+    root.setLevel(level)
+    root.addHandler(queue_handler)
+
+    listener = logging.handlers.QueueListener(log_queue, file_handler, console, respect_handler_level=True)
+    listener.start()
+    return LoggingSession(listener, queue_handler, file_handler, previous_level)
 
 # 爬取配置
 CRAWL_CONFIG = {
     'batch_size': 50,         # 每批处理的股票数量
-    'request_delay': 1.5,     # 每次请求间隔(秒)
+    'request_delay': 1.5,     # 相邻两次请求的最小间隔(秒)，所有抓取线程共享
     'batch_delay': 10,        # 每批处理后的延迟(秒)
     'retry_attempts': 3,      # 失败重试次数
-    'retry_delay': 5          # 重试间隔(秒)
+    'retry_delay': 5,         # 重试间隔(秒)
+    'fetch_workers': 4,       # 并发抓取线程数（受 request_delay 全局节流，不会提高请求频率）
+    'queue_size': 100,        # 抓取结果队列上限(只)，队列满时抓取线程阻塞
+    'write_batch_size': 50,   # 每个写入事务最多包含的股票数量
+    'progress_interval': 10,  # 汇总进度日志的输出间隔(秒)
+    'universe_cache': 'sp500_tickers.txt',  # 标普500成分股列表的本地缓存
+    'universe_refresh_days': 7                # 成分股缓存的有效期(天)
 }
 
 # 预定义的重点股票列表
@@ -67,20 +105,20 @@ def create_sp500_connection():
     """创建标普500数据库连接"""
     try:
         connection = sqlite3.connect(SP500_DB_PATH)
-        logging.info(f"标普500数据库连接成功: {SP500_DB_PATH}")
+        logger.debug(f"标普500数据库连接成功: {SP500_DB_PATH}")
         return connection
     except Exception as e:
-        logging.error(f"标普500数据库连接错误: {e}")
+        logger.error(f"标普500数据库连接错误: {e}")
         raise
 
 def create_priority_connection():
     """创建重点股票数据库连接"""
     try:
         connection = sqlite3.connect(PRIORITY_DB_PATH)
-        logging.info(f"重点股票数据库连接成功: {PRIORITY_DB_PATH}")
+        logger.debug(f"重点股票数据库连接成功: {PRIORITY_DB_PATH}")
         return connection
     except Exception as e:
-        logging.error(f"重点股票数据库连接错误: {e}")
+        logger.error(f"重点股票数据库连接错误: {e}")
         raise
 
 def init_sp500_database():
@@ -118,12 +156,13 @@ def init_sp500_database():
         
         # 创建索引以提高查询性能
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_assets_ticker ON Assets(ticker_symbol)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_history_asset_date ON PriceHistory(asset_id, date)")
+        create_query_indexes(cursor)
+        init_crawl_status_table(cursor)
         
         connection.commit()
-        logging.info("标普500数据库表初始化完成")
+        logger.info("标普500数据库表初始化完成")
     except Exception as e:
-        logging.error(f"创建标普500数据库表时出错: {e}")
+        logger.error(f"创建标普500数据库表时出错: {e}")
         raise
     finally:
         if connection:
@@ -164,12 +203,16 @@ def init_priority_database():
         
         # 创建索引以提高查询性能
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_assets_ticker ON Assets(ticker_symbol)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_history_asset_date ON PriceHistory(asset_id, date)")
+        create_query_indexes(cursor)
+        init_crawl_status_table(cursor)
+
+        # 创建投资组合相关表（持仓、交易、每日估值）
+        init_portfolio_tables(cursor)
         
         connection.commit()
-        logging.info("重点股票数据库表初始化完成")
+        logger.info("重点股票数据库表初始化完成")
     except Exception as e:
-        logging.error(f"创建重点股票数据库表时出错: {e}")
+        logger.error(f"创建重点股票数据库表时出错: {e}")
         raise
     finally:
         if connection:
@@ -178,7 +221,8 @@ def init_priority_database():
 def get_sp500_tickers():
     """获取标普500成分股列表"""
     try:
-        logging.info("正在获取标普500成分股列表...")
+        logger.info("正在获取标普500成分股列表...")
+        import pandas as pd
         table = pd.read_html('https://en.wikipedia.org/wiki/List_of_S%26P_500_companies')
         df = table[0]
         tickers = df['Symbol'].tolist()
@@ -186,246 +230,502 @@ def get_sp500_tickers():
         # 处理特殊符号
         tickers = [ticker.replace('.', '-') for ticker in tickers]
         
-        logging.info(f"成功获取 {len(tickers)} 只标普500成分股")
+        logger.info(f"成功获取 {len(tickers)} 只标普500成分股")
         return tickers
     except Exception as e:
-        logging.error(f"获取标普500成分股失败: {e}")
+        logger.error(f"获取标普500成分股失败: {e}")
         return []
 
-@retry(tries=CRAWL_CONFIG['retry_attempts'], delay=CRAWL_CONFIG['retry_delay'])
-def fetch_and_store_sp500_data(ticker):
-    """获取标普500成分股数据并存储到数据库"""
+def _read_ticker_cache(cache_path):
+    with open(cache_path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+def load_sp500_tickers():
+    """获取标普500成分股列表：缓存未过期时直接读取本地文件，避免每次运行都访问网络"""
+    cache_path = CRAWL_CONFIG['universe_cache']
+    max_age = CRAWL_CONFIG['universe_refresh_days'] * 24 * 3600
+    cached = os.path.exists(cache_path)
+    if cached and time.time() - os.path.getmtime(cache_path) < max_age:
+        tickers = _read_ticker_cache(cache_path)
+        if tickers:
+            logger.info(f"使用缓存的标普500成分股列表（{len(tickers)} 只）: {cache_path}")
+            return tickers
+
+    tickers = get_sp500_tickers()
+    if tickers:
+        with open(cache_path, 'w') as f:
+            f.write('\n'.join(tickers))
+    elif cached:
+        # 网络获取失败时退回到过期的缓存
+        tickers = _read_ticker_cache(cache_path)
+        logger.warning(f"使用过期的标普500成分股缓存（{len(tickers)} 只）")
+    return tickers
+
+def fetch_ticker_data(ticker, period="30d"):
+    """从雅虎财经获取单只股票的资产信息和历史价格（失败自动重试），返回待写入的记录（不访问数据库）"""
+    from retry.api import retry_call
+    return retry_call(
+        _fetch_ticker_data_once,
+        fargs=[ticker, period],
+        tries=CRAWL_CONFIG['retry_attempts'],
+        delay=CRAWL_CONFIG['retry_delay']
+    )
+
+class RateLimiter:
+    """多个抓取线程共享的请求节流器：相邻两次请求的开始时间至少间隔 request_delay 秒"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._next_allowed = 0.0
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_allowed)
+            self._next_allowed = start + CRAWL_CONFIG['request_delay']
+        if start > now:
+            time.sleep(start - now)
+
+# 全局请求节流器（包括重试在内的每次请求都要经过）
+_request_limiter = RateLimiter()
+
+def _fetch_ticker_data_once(ticker, period):
+    """单次请求雅虎财经，不做重试"""
+    import yfinance as yf
+
+    _request_limiter.wait()
     try:
         # 获取资产数据
         asset = yf.Ticker(ticker)
         info = asset.info
-        
+
         # 获取历史价格数据
-        hist = asset.history(period="30d")
-        
+        hist = asset.history(period=period)
+
         if hist.empty:
-            logging.warning(f"❌ {ticker} 没有可用的历史价格数据")
-            return False
-        
-        connection = create_sp500_connection()
-        cursor = connection.cursor()
-        
-        # 插入或更新资产主表
-        try:
-            cursor.execute(
-                """
-                INSERT OR REPLACE INTO Assets 
-                (ticker_symbol, name, asset_type, currency)
-                VALUES (?, ?, ?, ?)
-                """,
-                (
-                    ticker,
-                    info.get('longName', f'{ticker} Inc.'),
-                    'stock',
-                    info.get('currency', 'USD')
-                )
-            )
-            
-            # 获取插入的asset_id
-            cursor.execute("SELECT asset_id FROM Assets WHERE ticker_symbol = ?", (ticker,))
-            asset_id = cursor.fetchone()[0]
-            
-            # 批量插入价格历史数据
-            price_records = []
-            for date, row in hist.iterrows():
-                price_records.append((
-                    asset_id,
-                    date.date(),
-                    row['Open'],
-                    row['High'],
-                    row['Low'],
-                    row['Close'],
-                    row['Volume']
-                ))
-            
-            cursor.executemany(
-                """
-                INSERT OR REPLACE INTO PriceHistory 
-                (asset_id, date, open_price, high_price, low_price, close_price, volume)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-                """,
-                price_records
-            )
-            
-            connection.commit()
-            logging.info(f"✅ 标普500成分股 {ticker} 数据已成功更新（{len(price_records)} 天价格数据）")
-            return True
-            
-        except Exception as e:
-            connection.rollback()
-            logging.error(f"❌ 存储标普500成分股 {ticker} 数据时数据库操作失败: {e}")
-            return False
-        finally:
-            if connection:
-                connection.close()
-                
+            logger.warning(f"❌ {ticker} 没有可用的历史价格数据")
+            return None
+
+        asset_record = (
+            ticker,
+            info.get('longName', f'{ticker} Inc.'),
+            'stock',
+            info.get('currency', 'USD')
+        )
+
+        # 在抓取线程中完成 DataFrame 到元组的转换，写入线程只负责落盘；
+        # 收盘数据可用之前抓到的当日 K 线只是盘中快照，丢弃以免被当作收盘价保存
+        last_complete = expected_latest_bar().isoformat()
+        price_records = [
+            (date.date().isoformat(), float(open_), float(high), float(low), float(close),
+             int(volume) if volume == volume else None)
+            for date, open_, high, low, close, volume
+            in hist[['Open', 'High', 'Low', 'Close', 'Volume']].itertuples(name=None)
+            if date.date().isoformat() <= last_complete
+        ]
+        return asset_record, price_records
+
     except Exception as e:
-        logging.error(f"❌ 获取或存储标普500成分股 {ticker} 数据时出错: {e}")
+        logger.error(f"❌ 获取 {ticker} 数据时出错: {e}")
         raise
 
-@retry(tries=CRAWL_CONFIG['retry_attempts'], delay=CRAWL_CONFIG['retry_delay'])
+# write_ticker_batch 中价格记录各字段对应的 SQL 参数名
+PRICE_RECORD_FIELDS = ('asset_id', 'date', 'open', 'high', 'low', 'close', 'volume')
+
+def write_ticker_batch(connection, items):
+    """在单个事务中写入多只股票的资产信息和价格记录，返回实际新增或变更的价格记录数"""
+    cursor = connection.cursor()
+    rows = 0
+    for asset_record, price_records in items:
+        # 使用 UPSERT 保留已有的 asset_id（INSERT OR REPLACE 会重新分配 asset_id，导致历史价格成为孤儿记录）
+        cursor.execute(
+            """
+            INSERT INTO Assets
+            (ticker_symbol, name, asset_type, currency)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(ticker_symbol) DO UPDATE SET
+                name = excluded.name,
+                asset_type = excluded.asset_type,
+                currency = excluded.currency
+            """,
+            asset_record
+        )
+
+        # 获取资产的asset_id
+        cursor.execute("SELECT asset_id FROM Assets WHERE ticker_symbol = ?", (asset_record[0],))
+        asset_id = cursor.fetchone()[0]
+
+        # 每次都会重新抓取最近一段时间的价格，与已存储记录完全相同的行直接跳过，
+        # 只替换新增或被修正的行，使 history_id 仅在数据真正变化时更新（增量导出依赖这一点）
+        cursor.executemany(
+            """
+            INSERT OR REPLACE INTO PriceHistory
+            (asset_id, date, open_price, high_price, low_price, close_price, volume)
+            SELECT :asset_id, :date, :open, :high, :low, :close, :volume
+            WHERE NOT EXISTS (
+                SELECT 1 FROM PriceHistory
+                WHERE asset_id = :asset_id AND date = :date
+                  AND (open_price, high_price, low_price, close_price, volume)
+                      IS (:open, :high, :low, :close, :volume)
+            )
+            """,
+            [dict(zip(PRICE_RECORD_FIELDS, (asset_id,) + record)) for record in price_records]
+        )
+        rows += cursor.rowcount
+
+    connection.commit()
+    return rows
+
+def _earliest_date(items):
+    """一批记录中最早的价格日期，用于确定需要重新估值的起点"""
+    return min((record[0] for _, price_records in items for record in price_records), default=None)
+
+def _revalue_portfolio(connection, earliest_date):
+    """价格更新后从最早受影响的日期起增量重估组合，失败不影响爬取结果"""
+    if earliest_date is None:
+        return
+    try:
+        days = on_prices_updated(connection, earliest_date)
+        if days:
+            logger.info(f"组合估值已从 {earliest_date} 起更新，共 {days} 天")
+    except Exception as e:
+        logger.error(f"更新组合估值时出错: {e}")
+
+def _fetch_and_store(ticker, connect_function, label):
+    """获取单只股票数据并立即写入数据库（非流水线方式）"""
+    data = fetch_ticker_data(ticker)
+    if data is None:
+        return False
+
+    connection = connect_function()
+    try:
+        rows = write_ticker_batch(connection, [data])
+        logger.debug(f"✅ {label} {ticker} 数据已成功更新（{rows} 天价格数据）")
+        _revalue_portfolio(connection, _earliest_date([data]))
+        return True
+    except Exception as e:
+        connection.rollback()
+        logger.error(f"❌ 存储{label} {ticker} 数据时数据库操作失败: {e}")
+        return False
+    finally:
+        connection.close()
+
+def fetch_and_store_sp500_data(ticker):
+    """获取标普500成分股数据并存储到数据库"""
+    return _fetch_and_store(ticker, create_sp500_connection, "标普500成分股")
+
 def fetch_and_store_priority_data(ticker):
     """获取重点股票数据并存储到数据库"""
-    try:
-        # 获取资产数据
-        asset = yf.Ticker(ticker)
-        info = asset.info
-        
-        # 获取历史价格数据
-        hist = asset.history(period="30d")
-        
-        if hist.empty:
-            logging.warning(f"❌ {ticker} 没有可用的历史价格数据")
-            return False
-        
-        connection = create_priority_connection()
-        cursor = connection.cursor()
-        
-        # 插入或更新资产主表
+    return _fetch_and_store(ticker, create_priority_connection, "重点股票")
+
+# 写入队列的结束标记
+_STOP = object()
+
+class PipelineStats:
+    """抓取/写入流水线各阶段的耗时与吞吐统计（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.processed = 0        # 已处理（抓取结束）的股票数
+        self.failed = 0           # 抓取失败的股票数
+        self.fetched = 0          # 抓取成功的股票数
+        self.fetch_busy = 0.0     # 抓取线程累计网络耗时(秒)
+        self.put_wait = 0.0       # 抓取线程因队列已满而阻塞的时间（写入端是瓶颈）
+        self.written = 0          # 写入成功的股票数
+        self.written_rows = 0     # 写入的价格记录数
+        self.transactions = 0     # 写入事务数
+        self.write_busy = 0.0     # 写入线程累计落盘耗时(秒)
+        self.get_wait = 0.0       # 写入线程等待新数据的时间（网络端是瓶颈）
+
+    def add(self, **deltas):
+        with self._lock:
+            for name, value in deltas.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def log_progress(self, batch_name, total):
+        """输出一行汇总进度：速度、预计剩余时间和失败率"""
+        elapsed = time.perf_counter() - self.started
+        done = self.processed
+        rate = done / elapsed if elapsed else 0.0
+        eta = f"{(total - done) / rate:.0f} 秒" if rate else "未知"
+        failure_rate = self.failed / done if done else 0.0
+        logger.info(
+            f"{batch_name}进度: {done}/{total}（{done / total:.0%}），{rate:.2f} 只/秒，"
+            f"预计剩余 {eta}，失败率 {failure_rate:.1%}，已写入 {self.written} 只"
+        )
+
+    def report(self, batch_name):
+        elapsed = time.perf_counter() - self.started
+        fetch_rate = self.fetched / self.fetch_busy if self.fetch_busy else 0.0
+        write_rate = self.written_rows / self.write_busy if self.write_busy else 0.0
+        logger.info(f"{batch_name}流水线总耗时: {elapsed:.1f} 秒")
+        logger.info(
+            f"抓取阶段: {self.fetched} 只，网络耗时 {self.fetch_busy:.1f} 秒（{fetch_rate:.2f} 只/秒/线程），"
+            f"队列满阻塞 {self.put_wait:.1f} 秒"
+        )
+        logger.info(
+            f"写入阶段: {self.written} 只 / {self.written_rows} 条记录，{self.transactions} 个事务，"
+            f"落盘耗时 {self.write_busy:.2f} 秒（{write_rate:.0f} 条/秒），等待数据 {self.get_wait:.1f} 秒"
+        )
+
+def _fetch_worker(ticker_queue, record_queue, stats, failed_tickers, no_data_tickers, writer_errors, period):
+    """抓取线程：从任务队列取股票代码，抓取并解析后放入有界写入队列
+
+    写入线程异常退出后不再发起请求，剩余股票直接记为失败。
+    """
+    while True:
+        ticker = ticker_queue.get()
+        if ticker is None:
+            ticker_queue.task_done()
+            break
         try:
-            cursor.execute(
-                """
-                INSERT OR REPLACE INTO Assets 
-                (ticker_symbol, name, asset_type, currency)
-                VALUES (?, ?, ?, ?)
-                """,
-                (
-                    ticker,
-                    info.get('longName', f'{ticker} Inc.'),
-                    'stock',
-                    info.get('currency', 'USD')
-                )
-            )
-            
-            # 获取插入的asset_id
-            cursor.execute("SELECT asset_id FROM Assets WHERE ticker_symbol = ?", (ticker,))
-            asset_id = cursor.fetchone()[0]
-            
-            # 批量插入价格历史数据
-            price_records = []
-            for date, row in hist.iterrows():
-                price_records.append((
-                    asset_id,
-                    date.date(),
-                    row['Open'],
-                    row['High'],
-                    row['Low'],
-                    row['Close'],
-                    row['Volume']
-                ))
-            
-            cursor.executemany(
-                """
-                INSERT OR REPLACE INTO PriceHistory 
-                (asset_id, date, open_price, high_price, low_price, close_price, volume)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-                """,
-                price_records
-            )
-            
-            connection.commit()
-            logging.info(f"✅ 重点股票 {ticker} 数据已成功更新（{len(price_records)} 天价格数据）")
-            return True
-            
-        except Exception as e:
-            connection.rollback()
-            logging.error(f"❌ 存储重点股票 {ticker} 数据时数据库操作失败: {e}")
-            return False
+            if writer_errors:
+                failed_tickers.append(ticker)
+                continue
+            start = time.perf_counter()
+            try:
+                data = fetch_ticker_data(ticker, period)
+                if data is None:
+                    no_data_tickers.append(ticker)
+            except Exception:
+                data = None
+                failed_tickers.append(ticker)
+                stats.add(failed=1)
+            stats.add(processed=1, fetch_busy=time.perf_counter() - start)
+
+            if data is not None:
+                stats.add(fetched=1)
+                # 队列已满时阻塞，形成背压，保证内存占用有上限
+                start = time.perf_counter()
+                record_queue.put(data)
+                stats.add(put_wait=time.perf_counter() - start)
         finally:
-            if connection:
-                connection.close()
-                
+            ticker_queue.task_done()
+
+def _flush_batch(connection, batch, label, stats, stored_tickers, failed_tickers):
+    """将一批记录写入数据库；整批失败时逐只重试以隔离出错的股票
+
+    返回成功写入记录中最早的价格日期。
+    """
+    start = time.perf_counter()
+    try:
+        rows = write_ticker_batch(connection, batch)
+        stats.add(written=len(batch), written_rows=rows, transactions=1)
+        for asset_record, price_records in batch:
+            stored_tickers.append(asset_record[0])
+            logger.debug(f"✅ {label} {asset_record[0]} 数据已成功更新（{len(price_records)} 天价格数据）")
+        return _earliest_date(batch)
     except Exception as e:
-        logging.error(f"❌ 获取或存储重点股票 {ticker} 数据时出错: {e}")
-        raise
+        connection.rollback()
+        if len(batch) > 1:
+            dates = [_flush_batch(connection, [item], label, stats, stored_tickers, failed_tickers) for item in batch]
+            return min((d for d in dates if d is not None), default=None)
+        failed_tickers.append(batch[0][0][0])
+        logger.error(f"❌ 存储{label} {batch[0][0][0]} 数据时数据库操作失败: {e}")
+        return None
+    finally:
+        stats.add(write_busy=time.perf_counter() - start)
+
+def _write_worker(connection, record_queue, label, stats, stored_tickers, failed_tickers, writer_errors):
+    """写入线程：从队列批量取出记录，以大事务写入 SQLite
+
+    连接由调用方在启动线程前打开，写入线程负责关闭。出现意外异常时记入 writer_errors，
+    并继续取空队列直到结束标记，避免抓取线程在队列已满时永久阻塞。
+    """
+    earliest_date = None
+    done = False
+    try:
+        while not done:
+            start = time.perf_counter()
+            item = record_queue.get()
+            stats.add(get_wait=time.perf_counter() - start)
+
+            # 取出队列中已就绪的记录，凑成一个事务
+            batch = []
+            while item is not _STOP:
+                batch.append(item)
+                if len(batch) >= CRAWL_CONFIG['write_batch_size']:
+                    break
+                try:
+                    item = record_queue.get_nowait()
+                except queue.Empty:
+                    break
+            done = item is _STOP
+
+            if batch:
+                written = _flush_batch(connection, batch, label, stats, stored_tickers, failed_tickers)
+                if written is not None and (earliest_date is None or written < earliest_date):
+                    earliest_date = written
+
+        # 所有价格落盘后统一重估一次组合，只从最早受影响的日期开始
+        _revalue_portfolio(connection, earliest_date)
+    except Exception as e:
+        logger.critical(f"{label}写入线程异常退出: {e}", exc_info=True)
+        writer_errors.append(e)
+        while not done:
+            item = record_queue.get()
+            done = item is _STOP
+            if not done:
+                failed_tickers.append(item[0][0])
+    finally:
+        connection.close()
+
+def _report_progress(stats, batch_name, total, stop_event):
+    """进度线程：定期输出汇总进度，替代逐只股票的日志"""
+    while not stop_event.wait(CRAWL_CONFIG['progress_interval']):
+        stats.log_progress(batch_name, total)
+
+def _record_attempts(db_path, attempted_bar, stored_tickers, no_data_tickers, failed_tickers):
+    """记录本轮已尝试抓取的股票：成功或无数据的股票同一预期交易日内不再重复抓取，
+    出错的股票下次运行仍会重试；记录失败不影响爬取结果"""
+    attempts = (
+        [(ticker, 'ok') for ticker in stored_tickers]
+        + [(ticker, 'no_data') for ticker in no_data_tickers]
+        + [(ticker, 'failed') for ticker in failed_tickers]
+    )
+    connection = sqlite3.connect(db_path)
+    try:
+        record_crawl_attempts(connection, attempts, attempted_bar)
+    except Exception as e:
+        logger.error(f"记录抓取状态时出错: {e}")
+    finally:
+        connection.close()
+
+def fetch_all_assets_in_batches(tickers, batch_name, db_path, period="30d"):
+    """以抓取/写入流水线分批获取所有股票数据
 
-def fetch_all_assets_in_batches(tickers, fetch_function, batch_name, db_path):
-    """分批获取所有股票数据"""
+    多个抓取线程并发请求网络并把解析好的记录放入有界队列，
+    单个写入线程持续从队列取数据并批量提交，使网络与磁盘 IO 重叠。
+    """
     if not tickers:
-        logging.warning(f"没有提供 {batch_name} 股票列表")
+        logger.warning(f"没有提供 {batch_name} 股票列表")
         return 0, []
-    
+
     total_batches = (len(tickers) + CRAWL_CONFIG['batch_size'] - 1) // CRAWL_CONFIG['batch_size']
-    success_count = 0
+    stored_tickers = []
     failed_tickers = []
-    
-    logging.info(f"开始爬取 {len(tickers)} 只{batch_name}股票数据，共 {total_batches} 批...")
-    logging.info(f"{batch_name}股票数据将存储到: {db_path}")
-    
-    for batch_num in range(total_batches):
-        start_idx = batch_num * CRAWL_CONFIG['batch_size']
-        end_idx = min((batch_num + 1) * CRAWL_CONFIG['batch_size'], len(tickers))
-        batch_tickers = tickers[start_idx:end_idx]
-        
-        logging.info(f"\n=== 处理第 {batch_num+1}/{total_batches} 批{batch_name}股票，共 {len(batch_tickers)} 只 ===")
-        
-        for i, ticker in enumerate(batch_tickers, 1):
-            logging.info(f"({i}/{len(batch_tickers)}) 处理: {ticker}")
-            try:
-                if fetch_function(ticker):
-                    success_count += 1
-            except Exception as e:
-                failed_tickers.append(ticker)
-            
-            # 请求间隔
-            if i < len(batch_tickers):
-                time.sleep(CRAWL_CONFIG['request_delay'])
-        
-        # 批次间延迟
-        if batch_num < total_batches - 1:
-            logging.info(f"批次处理完成，等待 {CRAWL_CONFIG['batch_delay']} 秒后继续...")
-            time.sleep(CRAWL_CONFIG['batch_delay'])
-    
+    no_data_tickers = []
+    stats = PipelineStats()
+    attempted_bar = expected_latest_bar().isoformat()
+
+    logger.info(f"开始爬取 {len(tickers)} 只{batch_name}股票数据，共 {total_batches} 批...")
+    logger.info(f"{batch_name}股票数据将存储到: {db_path}")
+
+    ticker_queue = queue.Queue()
+    record_queue = queue.Queue(maxsize=CRAWL_CONFIG['queue_size'])
+    writer_errors = []
+
+    # 在启动任何线程之前打开写入连接，路径或权限错误直接抛出，而不是让流水线卡死
+    connection = sqlite3.connect(db_path, check_same_thread=False)
+    writer = threading.Thread(
+        target=_write_worker,
+        args=(connection, record_queue, batch_name, stats, stored_tickers, failed_tickers, writer_errors),
+        name=f"writer-{batch_name}"
+    )
+    writer.start()
+    workers = [
+        threading.Thread(
+            target=_fetch_worker,
+            args=(ticker_queue, record_queue, stats, failed_tickers, no_data_tickers, writer_errors, period),
+            name=f"fetcher-{batch_name}-{i}",
+            daemon=True
+        )
+        for i in range(CRAWL_CONFIG['fetch_workers'])
+    ]
+    for worker in workers:
+        worker.start()
+    stop_progress = threading.Event()
+    reporter = threading.Thread(
+        target=_report_progress,
+        args=(stats, batch_name, len(tickers), stop_progress),
+        name=f"progress-{batch_name}",
+        daemon=True
+    )
+    reporter.start()
+
+    try:
+        for batch_num in range(total_batches):
+            start_idx = batch_num * CRAWL_CONFIG['batch_size']
+            end_idx = min((batch_num + 1) * CRAWL_CONFIG['batch_size'], len(tickers))
+            batch_tickers = tickers[start_idx:end_idx]
+
+            logger.info(f"\n=== 处理第 {batch_num+1}/{total_batches} 批{batch_name}股票，共 {len(batch_tickers)} 只 ===")
+
+            for ticker in batch_tickers:
+                ticker_queue.put(ticker)
+            # 等待本批抓取完成；写入线程在此期间继续落盘
+            ticker_queue.join()
+            if writer_errors:
+                break
+
+            # 批次间延迟
+            if batch_num < total_batches - 1:
+                logger.info(f"批次处理完成，等待 {CRAWL_CONFIG['batch_delay']} 秒后继续...")
+                time.sleep(CRAWL_CONFIG['batch_delay'])
+    finally:
+        for _ in workers:
+            ticker_queue.put(None)
+        for worker in workers:
+            worker.join()
+        record_queue.put(_STOP)
+        writer.join()
+        stop_progress.set()
+        reporter.join()
+        _record_attempts(db_path, attempted_bar, stored_tickers, no_data_tickers, failed_tickers)
+
+    if writer_errors:
+        raise RuntimeError(f"{batch_name}股票数据写入失败，爬取已中止") from writer_errors[0]
+
+    success_count = len(stored_tickers)
+
     # 输出结果统计
-    logging.info(f"\n===== {batch_name}股票爬取完成 =====")
-    logging.info(f"总股票数: {len(tickers)}")
-    logging.info(f"成功: {success_count}")
-    logging.info(f"失败: {len(failed_tickers)}")
-    
+    logger.info(f"\n===== {batch_name}股票爬取完成 =====")
+    logger.info(f"总股票数: {len(tickers)}")
+    logger.info(f"成功: {success_count}")
+    logger.info(f"失败: {len(failed_tickers)}")
+    stats.report(batch_name)
+
     if failed_tickers:
-        logging.info(f"失败的股票: {failed_tickers}")
+        logger.info(f"失败的股票: {failed_tickers}")
         with open(f'failed_{batch_name.lower().replace(" ", "_")}_tickers.txt', 'w') as f:
             f.write('\n'.join(failed_tickers))
-    
+
     return success_count, failed_tickers
 
+def crawl_stale_assets(now=None):
+    """按交易日历只抓取数据已过期的股票：先处理重点股票，再处理标普500成分股"""
+    plans = [
+        (plan_crawl(PRIORITY_TICKERS, PRIORITY_DB_PATH, PRIORITY_TICKERS, now), "重点", PRIORITY_DB_PATH),
+        (plan_crawl(load_sp500_tickers(), SP500_DB_PATH, PRIORITY_TICKERS, now), "标普500", SP500_DB_PATH),
+    ]
+    results = {}
+    for tickers, batch_name, db_path in plans:
+        if not tickers:
+            logger.info(f"{batch_name}股票数据均已是最新，无需抓取")
+            results[batch_name] = (0, [])
+            continue
+        results[batch_name] = fetch_all_assets_in_batches(tickers, batch_name, db_path)
+    return results
+
 if __name__ == "__main__":
-    logging.info("===== 股票数据爬取程序启动 =====")
+    logging_session = setup_logging()
+    logger.info("===== 股票数据爬取程序启动 =====")
     
     try:
         # 初始化数据库
         init_sp500_database()
         init_priority_database()
         
-        # 获取标普500成分股列表
-        sp500_tickers = get_sp500_tickers()
-        
-        # 爬取标普500数据
-        sp500_success, sp500_failed = fetch_all_assets_in_batches(
-            sp500_tickers, 
-            fetch_and_store_sp500_data, 
-            "标普500",
-            SP500_DB_PATH
-        )
-        
-        # 爬取重点股票数据
-        priority_success, priority_failed = fetch_all_assets_in_batches(
-            PRIORITY_TICKERS, 
-            fetch_and_store_priority_data, 
-            "重点",
-            PRIORITY_DB_PATH
-        )
+        # 只爬取过期的股票数据（重点股票优先）
+        crawl_stale_assets()
         
-        logging.info(f"标普500数据已成功保存到: {SP500_DB_PATH}")
-        logging.info(f"重点股票数据已成功保存到: {PRIORITY_DB_PATH}")
-        logging.info("===== 程序运行完成 =====")
+        logger.info(f"标普500数据已成功保存到: {SP500_DB_PATH}")
+        logger.info(f"重点股票数据已成功保存到: {PRIORITY_DB_PATH}")
+        logger.info("===== 程序运行完成 =====")
         
     except Exception as e:
-        logging.critical(f"程序运行出错: {e}", exc_info=True)
+        logger.critical(f"程序运行出错: {e}", exc_info=True)
     finally:
-        logging.info("程序已退出")
\ No newline at end of file
+        logger.info("程序已退出")
+        logging_session.stop()
\ No newline at end of file
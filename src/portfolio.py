@@ -0,0 +1,275 @@
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 数量比较容差，避免浮点误差导致的残余持仓
+QUANTITY_EPSILON = 1e-9
+
+
+def init_portfolio_tables(cursor):
+    """创建持仓、交易记录和每日估值表"""
+    # 当前持仓（由交易记录汇总而来，平均成本法）
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS Holdings (
+        holding_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        asset_id INTEGER NOT NULL UNIQUE,
+        quantity REAL NOT NULL,
+        cost_basis REAL NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (asset_id) REFERENCES Assets(asset_id)
+    )
+    """)
+
+    # 交易记录：买入数量为正，卖出数量为负
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS Transactions (
+        transaction_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        asset_id INTEGER NOT NULL,
+        trade_date DATE NOT NULL,
+        quantity REAL NOT NULL,
+        price REAL NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (asset_id) REFERENCES Assets(asset_id)
+    )
+    """)
+
+    # 预先计算的每日组合估值，供业绩图表直接读取
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS PortfolioValuation (
+        date DATE PRIMARY KEY,
+        market_value REAL NOT NULL,
+        net_invested REAL NOT NULL
+    )
+    """)
+
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_transactions_date "
+        "ON Transactions(trade_date, asset_id, quantity, price)"
+    )
+
+
+def _asset_id(cursor, ticker):
+    cursor.execute("SELECT asset_id FROM Assets WHERE ticker_symbol = ?", (ticker,))
+    row = cursor.fetchone()
+    if row is None:
+        raise ValueError(f"未知的股票代码: {ticker}")
+    return row[0]
+
+
+def _rebuild_holding(cursor, asset_id, ticker):
+    """按交易日顺序重放某只股票的全部交易，校验持仓并更新平均成本
+
+    同一交易日内先计买入再计卖出，因此只要每个交易日结束时持仓不为负即可通过；
+    补录的历史交易若导致之后任一交易日持仓为负，则抛出 ValueError。
+    """
+    cursor.execute(
+        """
+        SELECT trade_date, quantity, price FROM Transactions
+        WHERE asset_id = ? ORDER BY trade_date, quantity < 0, transaction_id
+        """,
+        (asset_id,)
+    )
+    held = cost_basis = 0.0
+    for trade_date, quantity, price in cursor.fetchall():
+        if quantity > 0:
+            cost_basis += quantity * price
+        else:
+            if -quantity > held + QUANTITY_EPSILON:
+                raise ValueError(f"{ticker} 在 {trade_date} 卖出 {-quantity}，超过当日持仓 {held}")
+            cost_basis -= cost_basis * min(-quantity / held, 1.0)
+        held += quantity
+        if held <= QUANTITY_EPSILON:
+            held = cost_basis = 0.0
+
+    if held <= QUANTITY_EPSILON:
+        cursor.execute("DELETE FROM Holdings WHERE asset_id = ?", (asset_id,))
+    else:
+        cursor.execute(
+            """
+            INSERT INTO Holdings (asset_id, quantity, cost_basis)
+            VALUES (?, ?, ?)
+            ON CONFLICT(asset_id) DO UPDATE SET
+                quantity = excluded.quantity,
+                cost_basis = excluded.cost_basis,
+                updated_at = CURRENT_TIMESTAMP
+            """,
+            (asset_id, held, cost_basis)
+        )
+
+
+def add_transaction(connection, ticker, trade_date, quantity, price):
+    """记录一笔交易，更新持仓，并从交易日起重新估值
+
+    quantity 为正表示买入，为负表示卖出；卖出数量不能超过交易日当天的持仓，
+    也不能使之后任一交易日的持仓变为负数。
+    """
+    if quantity == 0:
+        raise ValueError("交易数量不能为 0")
+    if price < 0:
+        raise ValueError(f"交易价格不能为负数: {price}")
+    trade_date = str(trade_date)
+
+    cursor = connection.cursor()
+    try:
+        asset_id = _asset_id(cursor, ticker)
+        cursor.execute(
+            "INSERT INTO Transactions (asset_id, trade_date, quantity, price) VALUES (?, ?, ?, ?)",
+            (asset_id, trade_date, quantity, price)
+        )
+        # 交易可能是补录的历史交易，因此按交易日顺序重算持仓和平均成本
+        _rebuild_holding(cursor, asset_id, ticker)
+
+        revalue_from(connection, trade_date)
+        connection.commit()
+        logger.info(f"已记录交易: {ticker} {quantity:+g} @ {price}（{trade_date}）")
+    except Exception:
+        connection.rollback()
+        raise
+
+
+def remove_holding(connection, ticker, trade_date, price):
+    """按给定价格卖出某只股票的全部持仓"""
+    cursor = connection.cursor()
+    cursor.execute(
+        "SELECT h.quantity FROM Holdings h JOIN Assets a ON a.asset_id = h.asset_id WHERE a.ticker_symbol = ?",
+        (ticker,)
+    )
+    row = cursor.fetchone()
+    if row is None:
+        raise ValueError(f"当前没有持有 {ticker}")
+    add_transaction(connection, ticker, trade_date, -row[0], price)
+
+
+def _effective_start(cursor, start_date):
+    """确定实际重估的起始日：不早于首笔交易，并覆盖估值序列中尚未计算的缺口"""
+    cursor.execute("SELECT MIN(trade_date) FROM Transactions")
+    first_trade = cursor.fetchone()[0]
+    if first_trade is None:
+        return None
+    start_date = max(str(start_date), first_trade)
+
+    cursor.execute("SELECT MAX(date) FROM PortfolioValuation WHERE date < ?", (start_date,))
+    last_valued = cursor.fetchone()[0]
+    if last_valued is None:
+        return first_trade
+    cursor.execute("SELECT MIN(date) FROM PriceHistory WHERE date > ?", (last_valued,))
+    next_date = cursor.fetchone()[0]
+    if next_date is not None and next_date < start_date:
+        return next_date
+    return start_date
+
+
+def revalue_from(connection, start_date):
+    """从 start_date 起重新计算每日组合估值，之前的估值保持不变（不提交事务）
+
+    返回写入的估值天数。
+    """
+    cursor = connection.cursor()
+    start_date = _effective_start(cursor, start_date)
+    if start_date is None:
+        cursor.execute("DELETE FROM PortfolioValuation")
+        return 0
+
+    # 起始日之前的持仓和累计净投入
+    positions = {}
+    net_invested = 0.0
+    cursor.execute(
+        """
+        SELECT asset_id, SUM(quantity), SUM(quantity * price)
+        FROM Transactions WHERE trade_date < ? GROUP BY asset_id
+        """,
+        (start_date,)
+    )
+    for asset_id, quantity, invested in cursor.fetchall():
+        positions[asset_id] = quantity
+        net_invested += invested
+
+    cursor.execute(
+        """
+        SELECT trade_date, asset_id, quantity, price FROM Transactions
+        WHERE trade_date >= ? ORDER BY trade_date, transaction_id
+        """,
+        (start_date,)
+    )
+    trades = cursor.fetchall()
+    asset_ids = sorted(set(positions) | {trade[1] for trade in trades})
+
+    # 每只股票在起始日之前最后一个收盘价，用于停牌或缺失数据时向前填充
+    last_close = {}
+    for asset_id in asset_ids:
+        cursor.execute(
+            """
+            SELECT close_price FROM PriceHistory
+            WHERE asset_id = ? AND date < ? AND close_price IS NOT NULL
+            ORDER BY date DESC LIMIT 1
+            """,
+            (asset_id, start_date)
+        )
+        row = cursor.fetchone()
+        if row is not None:
+            last_close[asset_id] = row[0]
+
+    cursor.execute(
+        """
+        SELECT date, asset_id, close_price FROM PriceHistory
+        WHERE asset_id IN (SELECT value FROM json_each(?)) AND date >= ? AND close_price IS NOT NULL
+        ORDER BY date
+        """,
+        (json.dumps(asset_ids), start_date)
+    )
+    prices = cursor.fetchall()
+    cursor.execute("SELECT DISTINCT date FROM PriceHistory WHERE date >= ? ORDER BY date", (start_date,))
+    dates = [row[0] for row in cursor.fetchall()]
+
+    # 按交易日依次应用交易和收盘价
+    valuations = []
+    t = p = 0
+    for date in dates:
+        while t < len(trades) and trades[t][0] <= date:
+            _, asset_id, quantity, price = trades[t]
+            positions[asset_id] = positions.get(asset_id, 0.0) + quantity
+            net_invested += quantity * price
+            last_close.setdefault(asset_id, price)
+            t += 1
+        while p < len(prices) and prices[p][0] <= date:
+            last_close[prices[p][1]] = prices[p][2]
+            p += 1
+        market_value = sum(quantity * last_close.get(asset_id, 0.0) for asset_id, quantity in positions.items())
+        valuations.append((date, market_value, net_invested))
+
+    cursor.execute("DELETE FROM PortfolioValuation WHERE date >= ?", (start_date,))
+    cursor.executemany(
+        "INSERT INTO PortfolioValuation (date, market_value, net_invested) VALUES (?, ?, ?)",
+        valuations
+    )
+    logger.debug(f"组合估值已从 {start_date} 起重新计算，共 {len(valuations)} 天")
+    return len(valuations)
+
+
+def on_prices_updated(connection, earliest_date):
+    """新价格写入后，从受影响的最早日期起重新估值；数据库中没有组合表时直接返回"""
+    cursor = connection.cursor()
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'Transactions'")
+    if cursor.fetchone() is None:
+        return 0
+    try:
+        count = revalue_from(connection, earliest_date)
+        connection.commit()
+        return count
+    except Exception:
+        connection.rollback()
+        raise
+
+
+def get_valuation_series(connection, start_date=None, end_date=None):
+    """读取预先计算好的每日组合估值序列 [(date, market_value, net_invested), ...]"""
+    cursor = connection.cursor()
+    cursor.execute(
+        """
+        SELECT date, market_value, net_invested FROM PortfolioValuation
+        WHERE date BETWEEN ? AND ? ORDER BY date
+        """,
+        (str(start_date or '0000-01-01'), str(end_date or '9999-12-31'))
+    )
+    return cursor.fetchall()
@@ -0,0 +1,181 @@
+import os
+import json
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from urllib.parse import quote
+from config import PRIORITY_DB_PATH
+
+# 查询层依赖的覆盖索引：索引本身包含查询所需的全部列，无需回表
+QUERY_INDEXES = [
+    """
+    CREATE INDEX IF NOT EXISTS idx_history_asset_date_cover ON PriceHistory
+    (asset_id, date, open_price, high_price, low_price, close_price, volume)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_history_date_cover ON PriceHistory
+    (date, asset_id, open_price, high_price, low_price, close_price, volume)
+    """,
+]
+
+# 被覆盖索引取代的旧索引（与 UNIQUE(asset_id, date) 的自动索引重复）
+OBSOLETE_INDEXES = ['idx_history_asset_date']
+
+# 所有 SQL 文本固定不变（股票列表以 JSON 数组作为单个参数传入），
+# 因此每个连接的语句缓存中每条查询只需编译一次
+LATEST_BARS_SQL = """
+    SELECT a.ticker_symbol, p.date, p.open_price, p.high_price, p.low_price, p.close_price, p.volume
+    FROM Assets a
+    JOIN PriceHistory p ON p.asset_id = a.asset_id
+    WHERE a.ticker_symbol IN (SELECT value FROM json_each(?))
+      AND p.date = (SELECT MAX(date) FROM PriceHistory WHERE asset_id = a.asset_id)
+    ORDER BY a.ticker_symbol
+"""
+
+PRICE_RANGE_SQL = """
+    SELECT p.date, p.open_price, p.high_price, p.low_price, p.close_price, p.volume
+    FROM PriceHistory p
+    WHERE p.asset_id = (SELECT asset_id FROM Assets WHERE ticker_symbol = ?)
+      AND p.date BETWEEN ? AND ?
+    ORDER BY p.date
+"""
+
+CROSS_SECTION_SQL = """
+    SELECT a.ticker_symbol, p.date, p.open_price, p.high_price, p.low_price, p.close_price, p.volume
+    FROM PriceHistory p
+    JOIN Assets a ON a.asset_id = p.asset_id
+    WHERE p.date = ?
+    ORDER BY a.ticker_symbol
+"""
+
+PORTFOLIO_HISTORY_SQL = """
+    SELECT a.ticker_symbol, p.date, p.open_price, p.high_price, p.low_price, p.close_price, p.volume
+    FROM Assets a
+    JOIN PriceHistory p ON p.asset_id = a.asset_id
+    WHERE a.ticker_symbol IN (SELECT value FROM json_each(?))
+      AND p.date BETWEEN ? AND ?
+    ORDER BY p.date, a.ticker_symbol
+"""
+
+# 查询名称 -> (SQL, 用于 EXPLAIN QUERY PLAN 的示例参数)
+QUERIES = {
+    'latest_bars': (LATEST_BARS_SQL, ('["AAPL"]',)),
+    'price_range': (PRICE_RANGE_SQL, ('AAPL', '2000-01-01', '2100-01-01')),
+    'cross_section': (CROSS_SECTION_SQL, ('2025-01-02',)),
+    'portfolio_history': (PORTFOLIO_HISTORY_SQL, ('["AAPL"]', '2000-01-01', '2100-01-01')),
+}
+
+
+def create_query_indexes(cursor):
+    """创建查询层所需的覆盖索引（需可写连接，在初始化数据库时调用）"""
+    for ddl in QUERY_INDEXES:
+        cursor.execute(ddl)
+    for name in OBSOLETE_INDEXES:
+        cursor.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+def read_only_uri(db_path):
+    """构造只读连接的 SQLite URI（路径需转义，否则含 ?、# 或 % 的文件名会被误解析）"""
+    return f"file:{quote(os.path.abspath(db_path))}?mode=ro"
+
+
+def find_full_scans(connection):
+    """对所有查询执行 EXPLAIN QUERY PLAN，返回出现全表扫描的 {查询名称: [计划步骤]}"""
+    scans = {}
+    for name, (sql, params) in QUERIES.items():
+        details = [row[3] for row in connection.execute("EXPLAIN QUERY PLAN " + sql, params)]
+        bad = [d for d in details if d.startswith('SCAN') and 'json_each' not in d]
+        if bad:
+            scans[name] = bad
+    return scans
+
+
+class PriceQuery:
+    """SQLite 价格库的只读查询层
+
+    维护一个只读连接池，所有查询均为集合式（一次查询返回多只股票），
+    并由覆盖索引支撑，避免全表扫描。
+    """
+
+    def __init__(self, db_path=PRIORITY_DB_PATH, pool_size=4, cached_statements=64):
+        self.db_path = db_path
+        self.cached_statements = cached_statements
+        self._pool = queue.LifoQueue()
+        self._pool_size = pool_size
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        connection = sqlite3.connect(
+            read_only_uri(self.db_path),
+            uri=True,
+            check_same_thread=False,
+            cached_statements=self.cached_statements
+        )
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA query_only = ON")
+        return connection
+
+    @contextmanager
+    def connection(self):
+        """从连接池借出一个只读连接，连接数达到上限时等待归还"""
+        try:
+            connection = self._pool.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self._pool_size
+                if create:
+                    self._created += 1
+            if create:
+                try:
+                    connection = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                connection = self._pool.get()
+        try:
+            yield connection
+        finally:
+            self._pool.put(connection)
+
+    def close(self):
+        """关闭池中所有空闲连接"""
+        while True:
+            try:
+                connection = self._pool.get_nowait()
+            except queue.Empty:
+                break
+            connection.close()
+            with self._lock:
+                self._created -= 1
+
+    def _fetch(self, sql, params):
+        with self.connection() as connection:
+            return [dict(row) for row in connection.execute(sql, params)]
+
+    def latest_bars(self, tickers):
+        """多只股票各自最新一个交易日的行情"""
+        return self._fetch(LATEST_BARS_SQL, (json.dumps(list(tickers)),))
+
+    def price_range(self, ticker, start_date, end_date):
+        """单只股票在日期区间内的行情（含首尾）"""
+        return self._fetch(PRICE_RANGE_SQL, (ticker, str(start_date), str(end_date)))
+
+    def cross_section(self, date):
+        """某一交易日所有股票的行情截面"""
+        return self._fetch(CROSS_SECTION_SQL, (str(date),))
+
+    def portfolio_history(self, tickers, start_date, end_date):
+        """一次查询返回组合内所有股票在日期区间内的行情，按日期排序"""
+        return self._fetch(
+            PORTFOLIO_HISTORY_SQL,
+            (json.dumps(list(tickers)), str(start_date), str(end_date))
+        )
+
+    def explain(self):
+        """返回出现全表扫描的查询及其计划步骤，空字典表示全部走索引"""
+        with self.connection() as connection:
+            return find_full_scans(connection)
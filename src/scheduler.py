@@ -0,0 +1,201 @@
+import os
+import sqlite3
+import logging
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+logger = logging.getLogger(__name__)
+
+# 交易所时区与收盘时间（纽约证券交易所）
+EXCHANGE_TZ = ZoneInfo('America/New_York')
+MARKET_CLOSE = time(16, 0)
+# 收盘后等待日线数据可用的时间
+BAR_AVAILABLE_DELAY = timedelta(minutes=30)
+
+
+def _nth_weekday(year, month, weekday, n):
+    """某月第 n 个星期几（n 为负数时从月末倒数）"""
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = date(year, month + 1, 1) - timedelta(days=1) if month < 12 else date(year, 12, 31)
+    return last - timedelta(days=(last.weekday() - weekday) % 7 + 7 * (-n - 1))
+
+
+def _easter(year):
+    """公历复活节日期（匿名格里高利算法）"""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def _observed(day):
+    """周六的节假日提前到周五休市，周日的顺延到周一"""
+    if day.weekday() == 5:
+        return day - timedelta(days=1)
+    if day.weekday() == 6:
+        return day + timedelta(days=1)
+    return day
+
+
+@lru_cache(maxsize=None)
+def nyse_holidays(year):
+    """纽约证券交易所某年的全天休市日"""
+    holidays = set()
+
+    # 元旦：落在周六时前一年 12 月 31 日照常交易
+    new_year = date(year, 1, 1)
+    if new_year.weekday() != 5:
+        holidays.add(_observed(new_year))
+
+    holidays.add(_nth_weekday(year, 1, 0, 3))       # 马丁·路德·金纪念日
+    holidays.add(_nth_weekday(year, 2, 0, 3))       # 总统日
+    holidays.add(_easter(year) - timedelta(days=2))  # 耶稣受难日
+    holidays.add(_nth_weekday(year, 5, 0, -1))      # 阵亡将士纪念日
+    if year >= 2022:
+        holidays.add(_observed(date(year, 6, 19)))  # 六月节
+    holidays.add(_observed(date(year, 7, 4)))       # 独立日
+    holidays.add(_nth_weekday(year, 9, 0, 1))       # 劳动节
+    holidays.add(_nth_weekday(year, 11, 3, 4))      # 感恩节
+    holidays.add(_observed(date(year, 12, 25)))     # 圣诞节
+    return frozenset(holidays)
+
+
+def is_trading_day(day):
+    """是否为交易日（工作日且非休市日）"""
+    return day.weekday() < 5 and day not in nyse_holidays(day.year)
+
+
+def previous_trading_day(day):
+    """严格早于 day 的最近一个交易日"""
+    day -= timedelta(days=1)
+    while not is_trading_day(day):
+        day -= timedelta(days=1)
+    return day
+
+
+def expected_latest_bar(now=None):
+    """当前时刻应当已经可以获取到的最新日线日期"""
+    now = datetime.now(EXCHANGE_TZ) if now is None else now.astimezone(EXCHANGE_TZ)
+    today = now.date()
+    available_at = datetime.combine(today, MARKET_CLOSE, tzinfo=EXCHANGE_TZ) + BAR_AVAILABLE_DELAY
+    if is_trading_day(today) and now >= available_at:
+        return today
+    return previous_trading_day(today)
+
+
+def init_crawl_status_table(cursor):
+    """创建抓取状态表：记录每只股票最近一次尝试抓取时对应的预期交易日
+
+    退市或暂无数据的股票永远不会有新价格，靠这张表避免每次运行都重复抓取。
+    """
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS CrawlStatus (
+        ticker_symbol TEXT PRIMARY KEY,
+        attempted_bar DATE NOT NULL,
+        status TEXT NOT NULL,
+        checked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+
+
+def record_crawl_attempts(connection, attempts, attempted_bar):
+    """记录一轮抓取的结果 attempts = [(ticker, status), ...]，status 为 ok / no_data / failed"""
+    connection.executemany(
+        """
+        INSERT INTO CrawlStatus (ticker_symbol, attempted_bar, status)
+        VALUES (?, ?, ?)
+        ON CONFLICT(ticker_symbol) DO UPDATE SET
+            attempted_bar = excluded.attempted_bar,
+            status = excluded.status,
+            checked_at = CURRENT_TIMESTAMP
+        """,
+        [(ticker, attempted_bar, status) for ticker, status in attempts]
+    )
+    connection.commit()
+
+
+def attempted_tickers(db_path, expected):
+    """已经针对 expected 交易日抓取过（成功或确认无数据）的股票集合
+
+    抓取出错（status = 'failed'）的股票仍然过期，不计入，下次运行会重新抓取。
+    """
+    if not os.path.exists(db_path):
+        return set()
+    connection = sqlite3.connect(db_path)
+    try:
+        cursor = connection.cursor()
+        cursor.execute(
+            "SELECT ticker_symbol FROM CrawlStatus WHERE attempted_bar >= ? AND status != 'failed'",
+            (expected,)
+        )
+        return {row[0] for row in cursor.fetchall()}
+    except sqlite3.OperationalError:
+        # 表尚未创建
+        return set()
+    finally:
+        connection.close()
+
+
+def latest_stored_dates(db_path):
+    """数据库中每只股票已存储的最新价格日期 {ticker: 'YYYY-MM-DD' 或 None}"""
+    if not os.path.exists(db_path):
+        return {}
+    connection = sqlite3.connect(db_path)
+    try:
+        cursor = connection.cursor()
+        cursor.execute("""
+            SELECT a.ticker_symbol, MAX(p.date)
+            FROM Assets a
+            LEFT JOIN PriceHistory p ON p.asset_id = a.asset_id
+            GROUP BY a.asset_id
+        """)
+        return dict(cursor.fetchall())
+    except sqlite3.OperationalError:
+        # 表尚未创建
+        return {}
+    finally:
+        connection.close()
+
+
+def plan_crawl(tickers, db_path, priority_tickers=(), now=None):
+    """返回需要抓取的过期股票列表：重点股票在前，其余保持原顺序并去重
+
+    已存储的最新日期不早于预期最新交易日的股票会被跳过；针对同一预期交易日已经成功抓取
+    或确认无数据的股票（例如退市）也会被跳过，到下一个交易日再重试；抓取出错的股票不跳过。
+    """
+    expected = expected_latest_bar(now).isoformat()
+    stored = latest_stored_dates(db_path)
+    attempted = attempted_tickers(db_path, expected)
+    priority = set(priority_tickers)
+
+    seen = set()
+    first, rest = [], []
+    skipped = 0
+    for ticker in tickers:
+        if ticker in seen:
+            continue
+        seen.add(ticker)
+        last = stored.get(ticker)
+        if last is not None and last >= expected:
+            continue
+        if ticker in attempted:
+            skipped += 1
+            continue
+        (first if ticker in priority else rest).append(ticker)
+
+    stale = first + rest
+    logger.info(
+        f"预期最新交易日 {expected}：{len(seen)} 只股票中 {len(stale)} 只需要更新，"
+        f"{skipped} 只本交易日已尝试过（{db_path}）"
+    )
+    return stale
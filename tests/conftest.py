@@ -0,0 +1,44 @@
+import os
+import sys
+import sqlite3
+
+import pytest
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC_DIR)
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """通过 init_priority_database 初始化的临时数据库"""
+    import new
+
+    path = str(tmp_path / 'test.db')
+    monkeypatch.setattr(new, 'PRIORITY_DB_PATH', path)
+    new.init_priority_database()
+    return path
+
+
+@pytest.fixture
+def insert_prices(db_path):
+    """写入价格记录：rows 为 [(ticker, date, close), ...]，开高低收均取 close"""
+    def insert(rows):
+        connection = sqlite3.connect(db_path)
+        try:
+            for ticker, date, close in rows:
+                connection.execute(
+                    "INSERT OR IGNORE INTO Assets (ticker_symbol, name, asset_type) VALUES (?, ?, 'stock')",
+                    (ticker, f'{ticker} Inc.')
+                )
+                connection.execute(
+                    """
+                    INSERT OR REPLACE INTO PriceHistory
+                    (asset_id, date, open_price, high_price, low_price, close_price, volume)
+                    SELECT asset_id, ?, ?, ?, ?, ?, 1000 FROM Assets WHERE ticker_symbol = ?
+                    """,
+                    (date, close, close, close, close, ticker)
+                )
+            connection.commit()
+        finally:
+            connection.close()
+    return insert
@@ -0,0 +1,70 @@
+import os
+import subprocess
+import sys
+
+from conftest import SRC_DIR
+
+# 在子进程中运行 CLI，确认轻量命令不会导入重量级依赖
+SCRIPT = """
+import sys
+sys.path.insert(0, {src!r})
+import cli
+code = cli.main({argv!r})
+heavy = sorted(name for name in ('yfinance', 'pandas', 'pyarrow', 'numpy') if name in sys.modules)
+print('HEAVY=' + ','.join(heavy))
+sys.exit(code)
+"""
+
+
+# 启动导入预算：import cli 目前约 40 毫秒，预算留有充足余量以免机器抖动误报；
+# 已知的重量级依赖（numpy 约 100 毫秒）另按模块名直接拦截
+IMPORT_BUDGET_US = 250_000
+HEAVY_MODULES = {'numpy', 'pandas', 'yfinance', 'pyarrow', 'retry'}
+
+
+def _run_cli(tmp_path, argv, *options):
+    # 文件名中的 # 和 ? 用于验证只读 URI 的转义
+    env = dict(
+        os.environ,
+        PRIORITY_DB_PATH=str(tmp_path / 'priority#1.db'),
+        SP500_DB_PATH=str(tmp_path / 'sp500?.db'),
+    )
+    return subprocess.run(
+        [sys.executable, *options, '-c', SCRIPT.format(src=os.path.abspath(SRC_DIR), argv=argv)],
+        cwd=tmp_path, env=env, capture_output=True, text=True, timeout=60
+    )
+
+
+def test_init_db_and_stats_skip_heavy_imports(tmp_path):
+    result = _run_cli(tmp_path, ['init-db'])
+    assert result.returncode == 0, result.stderr
+    assert 'HEAVY=\n' in result.stdout
+    assert (tmp_path / 'priority#1.db').exists()
+    assert (tmp_path / 'sp500?.db').exists()
+
+    result = _run_cli(tmp_path, ['stats'])
+    assert result.returncode == 0, result.stderr
+    assert 'HEAVY=\n' in result.stdout
+    assert '无法读取' not in result.stdout
+    assert '股票数: 0' in result.stdout
+
+
+def _import_times(stderr):
+    """解析 -X importtime 输出，返回 {模块名: 累计导入耗时(微秒)}"""
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_stats_startup_stays_within_import_budget(tmp_path):
+    assert _run_cli(tmp_path, ['init-db']).returncode == 0
+
+    result = _run_cli(tmp_path, ['stats'], '-X', 'importtime')
+    assert result.returncode == 0, result.stderr
+    times = _import_times(result.stderr)
+    assert not HEAVY_MODULES & {name.split('.')[0] for name in times}
+    assert times['cli'] < IMPORT_BUDGET_US, f"import cli 耗时 {times['cli'] / 1000:.0f} 毫秒"
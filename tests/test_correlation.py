@@ -0,0 +1,62 @@
+import numpy as np
+
+from correlation import CorrelationEngine
+
+DATES = ['2025-07-01', '2025-07-02', '2025-07-03', '2025-07-07', '2025-07-08', '2025-07-09']
+CLOSES = {
+    'AAA': [10.0, 10.5, 10.2, 10.8, 11.0, 10.7],
+    'BBB': [20.0, 19.6, 20.4, 20.1, 20.9, 21.3],
+    'CCC': [5.0, 5.1, 5.3, 5.2, 5.0, 5.4],
+}
+
+
+def _rows(dates):
+    return [(t, d, CLOSES[t][DATES.index(d)]) for t in CLOSES for d in dates]
+
+
+def test_covariance_matches_numpy(db_path, insert_prices):
+    insert_prices(_rows(DATES))
+    engine = CorrelationEngine(db_path).load()
+
+    assert np.allclose(engine.covariance(4), np.cov(engine.returns[-4:], rowvar=False))
+    assert np.allclose(np.diag(engine.correlation(4)), 1.0)
+
+
+def test_refresh_appends_new_days_incrementally(db_path, insert_prices):
+    insert_prices(_rows(DATES[:4]))
+    engine = CorrelationEngine(db_path).load()
+    engine.covariance(3)
+    engine.ewma_covariance()
+
+    insert_prices(_rows(DATES[4:]))
+    assert engine.refresh() == 2
+
+    expected = CorrelationEngine(db_path).load()
+    assert np.allclose(engine.covariance(3), expected.covariance(3))
+    assert np.allclose(engine.ewma_covariance(), expected.ewma_covariance())
+
+
+def test_refresh_picks_up_late_closes_for_partial_day(db_path, insert_prices):
+    insert_prices(_rows(DATES[:5]))
+    # 最新交易日只写入了部分股票（爬取进行中）
+    insert_prices([row for row in _rows(DATES[5:]) if row[0] == 'AAA'])
+    engine = CorrelationEngine(db_path).load()
+    engine.covariance(3)
+
+    insert_prices(_rows(DATES[5:]))
+    engine.refresh()
+
+    expected = CorrelationEngine(db_path).load()
+    assert engine.dates == expected.dates
+    assert np.allclose(engine.returns, expected.returns)
+    assert np.allclose(engine.covariance(3), expected.covariance(3))
+
+
+def test_refresh_picks_up_restated_close(db_path, insert_prices):
+    insert_prices(_rows(DATES))
+    engine = CorrelationEngine(db_path).load()
+    engine.covariance(3)
+
+    insert_prices([('BBB', DATES[3], 25.0)])
+    assert engine.refresh() == 1
+    assert np.allclose(engine.covariance(3), CorrelationEngine(db_path).load().covariance(3))
@@ -0,0 +1,149 @@
+import sqlite3
+import sys
+import threading
+import time
+import types
+from datetime import date
+
+import pytest
+
+import new
+
+
+def test_rate_limiter_paces_requests_across_threads(monkeypatch):
+    monkeypatch.setitem(new.CRAWL_CONFIG, 'request_delay', 0.05)
+    limiter = new.RateLimiter()
+    starts = []
+    lock = threading.Lock()
+
+    def worker():
+        for _ in range(3):
+            limiter.wait()
+            with lock:
+                starts.append(time.monotonic())
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # 12 次请求至少跨越 11 个间隔（sleep 只会多睡不会少睡，因此只检查总跨度）
+    assert len(starts) == 12
+    assert max(starts) - min(starts) >= 11 * 0.05 * 0.95
+
+
+def test_pipeline_writes_fetched_records(db_path, tmp_path, monkeypatch):
+    # 失败列表文件写在当前目录
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setitem(new.CRAWL_CONFIG, 'batch_delay', 0)
+    monkeypatch.setitem(new.CRAWL_CONFIG, 'write_batch_size', 3)
+
+    def fake_fetch(ticker, period="30d"):
+        if ticker == 'BAD':
+            raise RuntimeError("no data")
+        return (ticker, f'{ticker} Inc.', 'stock', 'USD'), [('2025-07-01', 1.0, 2.0, 0.5, 1.5, 100)]
+
+    monkeypatch.setattr(new, 'fetch_ticker_data', fake_fetch)
+    success, failed = new.fetch_all_assets_in_batches(['AAA', 'BAD', 'BBB', 'CCC', 'DDD'], "测试", db_path)
+
+    assert success == 4
+    assert failed == ['BAD']
+    connection = sqlite3.connect(db_path)
+    assert connection.execute("SELECT COUNT(*) FROM PriceHistory").fetchone()[0] == 4
+    connection.close()
+
+
+def test_pipeline_records_attempts(db_path, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(new, 'expected_latest_bar', lambda: date(2025, 7, 3))
+
+    def fake_fetch(ticker, period="30d"):
+        if ticker == 'BAD':
+            raise RuntimeError("network error")
+        if ticker == 'GONE':
+            return None
+        return (ticker, f'{ticker} Inc.', 'stock', 'USD'), [('2025-07-03', 1.0, 2.0, 0.5, 1.5, 100)]
+
+    monkeypatch.setattr(new, 'fetch_ticker_data', fake_fetch)
+    new.fetch_all_assets_in_batches(['AAA', 'BAD', 'GONE'], "测试", db_path)
+
+    connection = sqlite3.connect(db_path)
+    rows = connection.execute("SELECT ticker_symbol, attempted_bar, status FROM CrawlStatus ORDER BY 1").fetchall()
+    connection.close()
+    assert rows == [('AAA', '2025-07-03', 'ok'), ('BAD', '2025-07-03', 'failed'), ('GONE', '2025-07-03', 'no_data')]
+
+
+def test_fetch_drops_partial_intraday_bar(monkeypatch):
+    pd = pytest.importorskip('pandas')
+    history = pd.DataFrame(
+        {'Open': [1.0, 2.0], 'High': [1.0, 2.0], 'Low': [1.0, 2.0], 'Close': [1.0, 2.0], 'Volume': [10, 20]},
+        index=pd.to_datetime(['2025-07-03', '2025-07-07'])
+    )
+
+    class FakeTicker:
+        info = {'longName': 'Apple Inc.'}
+
+        def __init__(self, ticker):
+            pass
+
+        def history(self, period):
+            return history
+
+    monkeypatch.setitem(sys.modules, 'yfinance', types.SimpleNamespace(Ticker=FakeTicker))
+    monkeypatch.setitem(new.CRAWL_CONFIG, 'request_delay', 0)
+    # 7/7 收盘数据尚不可用，当日 K 线只是盘中快照
+    monkeypatch.setattr(new, 'expected_latest_bar', lambda: date(2025, 7, 3))
+
+    _, price_records = new._fetch_ticker_data_once('AAPL', '5d')
+    assert [record[0] for record in price_records] == ['2025-07-03']
+
+
+def _run_with_timeout(function, timeout=10):
+    """在后台线程中运行，防止流水线卡死时拖住整个测试"""
+    result = {}
+
+    def target():
+        try:
+            result['value'] = function()
+        except Exception as e:
+            result['error'] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "流水线没有在限定时间内返回"
+    return result
+
+
+def _fake_fetch(ticker, period="30d"):
+    return (ticker, f'{ticker} Inc.', 'stock', 'USD'), [('2025-07-01', 1.0, 2.0, 0.5, 1.5, 100)]
+
+
+def test_pipeline_raises_when_database_cannot_be_opened(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setitem(new.CRAWL_CONFIG, 'queue_size', 2)
+    monkeypatch.setattr(new, 'fetch_ticker_data', _fake_fetch)
+    db_path = str(tmp_path / 'missing' / 'test.db')
+
+    result = _run_with_timeout(
+        lambda: new.fetch_all_assets_in_batches([f'T{i}' for i in range(6)], "测试", db_path)
+    )
+    assert isinstance(result.get('error'), sqlite3.OperationalError)
+
+
+def test_pipeline_raises_when_writer_dies(db_path, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setitem(new.CRAWL_CONFIG, 'queue_size', 2)
+    monkeypatch.setitem(new.CRAWL_CONFIG, 'write_batch_size', 1)
+    monkeypatch.setattr(new, 'fetch_ticker_data', _fake_fetch)
+
+    def broken_flush(*args):
+        raise sqlite3.OperationalError("disk I/O error")
+
+    monkeypatch.setattr(new, '_flush_batch', broken_flush)
+    result = _run_with_timeout(
+        lambda: new.fetch_all_assets_in_batches([f'T{i}' for i in range(6)], "测试", db_path)
+    )
+    assert isinstance(result.get('error'), RuntimeError)
+    assert isinstance(result['error'].__cause__, sqlite3.OperationalError)
@@ -0,0 +1,93 @@
+import csv
+import json
+import sqlite3
+
+import pytest
+
+import export
+from export import export_price_history
+
+
+def _read(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        return [(row['date'], row['ticker_symbol'], float(row['close_price'])) for row in csv.DictReader(f)]
+
+
+def test_full_export_with_filters(db_path, insert_prices, tmp_path):
+    insert_prices([('AAPL', '2024-01-02', 1.0), ('AAPL', '2024-01-03', 2.0), ('MSFT', '2024-01-03', 3.0)])
+    output = tmp_path / 'out.csv'
+
+    assert export_price_history(db_path, str(output), tickers=['aapl'], start_date='2024-01-03') == 1
+    assert _read(output) == [('2024-01-03', 'AAPL', 2.0)]
+
+
+def test_resume_exports_late_backfilled_and_restated_rows(db_path, insert_prices, tmp_path):
+    state = str(tmp_path / 'state.json')
+    insert_prices([('MSFT', '2024-01-03', 3.0), ('MSFT', '2024-01-04', 4.0)])
+    assert export_price_history(db_path, str(tmp_path / 'day1.csv'), state_path=state, chunk_size=1) == 2
+
+    # 最后一个已导出日期晚到的 AAPL、补抓的更早日期，以及对已导出记录的修正
+    insert_prices([('AAPL', '2024-01-04', 10.0), ('AAPL', '2024-01-02', 9.0), ('MSFT', '2024-01-03', 3.5)])
+    day2 = tmp_path / 'day2.jsonl'
+    assert export_price_history(db_path, str(day2), state_path=state) == 3
+    with open(day2, encoding='utf-8') as f:
+        rows = [json.loads(line) for line in f]
+    assert [(r['date'], r['ticker_symbol'], r['close_price']) for r in rows] == [
+        ('2024-01-04', 'AAPL', 10.0),
+        ('2024-01-02', 'AAPL', 9.0),
+        ('2024-01-03', 'MSFT', 3.5),
+    ]
+
+    # 没有新写入时增量导出为空，状态保持不变
+    assert export_price_history(db_path, str(tmp_path / 'day3.csv'), state_path=state) == 0
+
+
+def test_parquet_export(db_path, insert_prices, tmp_path):
+    pq = pytest.importorskip('pyarrow.parquet')
+    insert_prices([('AAPL', '2024-01-02', 1.0), ('MSFT', '2024-01-02', 2.0)])
+    output = tmp_path / 'out.parquet'
+
+    assert export_price_history(db_path, str(output), chunk_size=1) == 2
+    assert pq.read_table(output).column('ticker_symbol').to_pylist() == ['AAPL', 'MSFT']
+
+
+def test_unsupported_output_does_not_leak_connection(db_path, tmp_path, monkeypatch):
+    closed = []
+
+    class TrackedConnection(sqlite3.Connection):
+        def close(self):
+            closed.append(self)
+            super().close()
+
+    connect = sqlite3.connect
+    monkeypatch.setattr(export.sqlite3, 'connect', lambda *a, **kw: connect(*a, factory=TrackedConnection, **kw))
+
+    with pytest.raises(ValueError):
+        export.export_price_history(db_path, '-', fmt='parquet')
+    with pytest.raises(OSError):
+        export.export_price_history(db_path, str(tmp_path / 'missing' / 'out.csv'))
+    assert len(closed) == 2
+
+
+def test_rewriting_identical_rows_exports_nothing(db_path, tmp_path):
+    import new
+
+    state = str(tmp_path / 'state.json')
+    records = [('2024-01-02', 1.0, 2.0, 0.5, 1.5, 100), ('2024-01-03', 1.5, 2.5, 1.0, 2.0, None)]
+    item = (('AAPL', 'Apple Inc.', 'stock', 'USD'), records)
+    connection = sqlite3.connect(db_path)
+    try:
+        assert new.write_ticker_batch(connection, [item]) == 2
+        assert export_price_history(db_path, str(tmp_path / 'day1.csv'), state_path=state) == 2
+
+        # 爬虫每次都会重抓最近的价格：未变化的行不应改变 history_id，也不应被再次导出
+        assert new.write_ticker_batch(connection, [item]) == 0
+        assert export_price_history(db_path, str(tmp_path / 'day2.csv'), state_path=state) == 0
+
+        restated = (item[0], [records[0], ('2024-01-03', 1.5, 2.5, 1.0, 2.2, 120)])
+        assert new.write_ticker_batch(connection, [restated]) == 1
+        day3 = tmp_path / 'day3.csv'
+        assert export_price_history(db_path, str(day3), state_path=state) == 1
+        assert _read(day3) == [('2024-01-03', 'AAPL', 2.2)]
+    finally:
+        connection.close()
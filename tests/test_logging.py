@@ -0,0 +1,42 @@
+import logging
+import os
+import subprocess
+import sys
+
+import new
+from conftest import SRC_DIR
+
+
+def test_import_configures_no_logging(tmp_path):
+    script = (
+        "import logging, os, sys\n"
+        f"sys.path.insert(0, {os.path.abspath(SRC_DIR)!r})\n"
+        "import new\n"
+        "print(len(logging.getLogger().handlers), os.path.exists('stock_crawler.log'))\n"
+    )
+    result = subprocess.run(
+        [sys.executable, '-c', script], cwd=tmp_path, capture_output=True, text=True, timeout=60
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == ['0', 'False']
+
+
+def test_setup_and_stop_restore_root_logger(tmp_path):
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    log_file = tmp_path / 'crawler.log'
+
+    for i in range(2):
+        session = new.setup_logging(str(log_file), level=logging.DEBUG)
+        new.logger.info(f"第 {i} 次运行")
+        session.stop()
+        session.stop()
+
+        assert root.handlers == handlers
+        assert root.level == level
+
+    # 停止后的日志不会再进入已失效的队列
+    new.logger.warning("停止之后")
+    content = log_file.read_text(encoding='utf-8')
+    assert "第 0 次运行" in content and "第 1 次运行" in content
+    assert "停止之后" not in content
@@ -0,0 +1,68 @@
+import sqlite3
+
+import pytest
+
+from portfolio import add_transaction, get_valuation_series, remove_holding
+
+
+@pytest.fixture
+def connection(db_path, insert_prices):
+    insert_prices([
+        ('AAPL', '2025-07-01', 100.0), ('AAPL', '2025-07-02', 110.0),
+        ('AAPL', '2025-07-03', 120.0), ('AAPL', '2025-07-07', 130.0),
+    ])
+    connection = sqlite3.connect(db_path)
+    yield connection
+    connection.close()
+
+
+def _holding(connection):
+    return connection.execute("SELECT quantity, cost_basis FROM Holdings").fetchone()
+
+
+def test_valuation_follows_transactions(connection):
+    add_transaction(connection, 'AAPL', '2025-07-02', 10, 110.0)
+    add_transaction(connection, 'AAPL', '2025-07-07', -4, 130.0)
+
+    assert get_valuation_series(connection) == [
+        ('2025-07-02', 1100.0, 1100.0),
+        ('2025-07-03', 1200.0, 1100.0),
+        ('2025-07-07', 780.0, 580.0),
+    ]
+    assert _holding(connection) == (6.0, 660.0)
+
+
+def test_rejects_sell_exceeding_position_on_trade_date(connection):
+    add_transaction(connection, 'AAPL', '2025-07-03', 10, 120.0)
+
+    # 当前持仓足够，但卖出日之前还没有买入
+    with pytest.raises(ValueError):
+        add_transaction(connection, 'AAPL', '2025-07-02', -5, 110.0)
+    assert connection.execute("SELECT COUNT(*) FROM Transactions").fetchone()[0] == 1
+
+
+def test_rejects_backdated_sell_that_breaks_later_position(connection):
+    add_transaction(connection, 'AAPL', '2025-07-01', 10, 100.0)
+    add_transaction(connection, 'AAPL', '2025-07-07', -8, 130.0)
+
+    # 7/2 卖出 5 股当天可行，但会让 7/7 的卖出超出持仓
+    with pytest.raises(ValueError):
+        add_transaction(connection, 'AAPL', '2025-07-02', -5, 110.0)
+    assert _holding(connection) == (2.0, 200.0)
+
+
+def test_average_cost_uses_trade_date_order(connection):
+    add_transaction(connection, 'AAPL', '2025-07-01', 10, 100.0)
+    add_transaction(connection, 'AAPL', '2025-07-07', -5, 130.0)
+    # 补录一笔更早的买入：7/7 卖出时的平均成本应为 (1000 + 1100) / 20
+    add_transaction(connection, 'AAPL', '2025-07-02', 10, 110.0)
+
+    assert _holding(connection) == (15.0, 1575.0)
+
+
+def test_remove_holding_clears_position(connection):
+    add_transaction(connection, 'AAPL', '2025-07-01', 10, 100.0)
+    remove_holding(connection, 'AAPL', '2025-07-03', 120.0)
+
+    assert _holding(connection) is None
+    assert get_valuation_series(connection, '2025-07-03')[-1] == ('2025-07-07', 0.0, -200.0)
@@ -0,0 +1,71 @@
+import sqlite3
+
+import pytest
+
+from query import PriceQuery, find_full_scans
+
+ROWS = [
+    ('AAPL', '2025-07-01', 210.0), ('AAPL', '2025-07-02', 212.0), ('AAPL', '2025-07-03', 211.0),
+    ('MSFT', '2025-07-01', 490.0), ('MSFT', '2025-07-02', 495.0),
+    ('NVDA', '2025-07-02', 150.0), ('NVDA', '2025-07-03', 155.0),
+]
+
+
+@pytest.fixture
+def query(db_path, insert_prices):
+    insert_prices(ROWS)
+    q = PriceQuery(db_path, pool_size=2)
+    yield q
+    q.close()
+
+
+def test_queries_use_indexes_without_full_scans(db_path):
+    connection = sqlite3.connect(db_path)
+    try:
+        assert find_full_scans(connection) == {}
+    finally:
+        connection.close()
+
+
+def test_full_scan_detected_without_covering_indexes(db_path):
+    connection = sqlite3.connect(db_path)
+    try:
+        connection.execute("DROP INDEX idx_history_date_cover")
+        assert 'cross_section' in find_full_scans(connection)
+    finally:
+        connection.close()
+
+
+def test_latest_bars(query):
+    bars = query.latest_bars(['AAPL', 'MSFT', 'UNKNOWN'])
+    assert [(b['ticker_symbol'], b['date'], b['close_price']) for b in bars] == [
+        ('AAPL', '2025-07-03', 211.0),
+        ('MSFT', '2025-07-02', 495.0),
+    ]
+
+
+def test_price_range(query):
+    bars = query.price_range('AAPL', '2025-07-02', '2025-07-03')
+    assert [(b['date'], b['close_price']) for b in bars] == [('2025-07-02', 212.0), ('2025-07-03', 211.0)]
+
+
+def test_cross_section(query):
+    bars = query.cross_section('2025-07-02')
+    assert [b['ticker_symbol'] for b in bars] == ['AAPL', 'MSFT', 'NVDA']
+
+
+def test_portfolio_history(query):
+    bars = query.portfolio_history(['MSFT', 'NVDA'], '2025-07-01', '2025-07-03')
+    assert [(b['date'], b['ticker_symbol']) for b in bars] == [
+        ('2025-07-01', 'MSFT'),
+        ('2025-07-02', 'MSFT'),
+        ('2025-07-02', 'NVDA'),
+        ('2025-07-03', 'NVDA'),
+    ]
+
+
+def test_connections_are_read_only(query):
+    with query.connection() as connection:
+        with pytest.raises(sqlite3.OperationalError):
+            connection.execute("DELETE FROM PriceHistory")
+    assert query.explain() == {}
@@ -0,0 +1,47 @@
+import sqlite3
+from datetime import date, datetime
+
+from scheduler import (
+    EXCHANGE_TZ, expected_latest_bar, is_trading_day, nyse_holidays, plan_crawl, record_crawl_attempts
+)
+
+
+def test_nyse_holidays():
+    holidays = nyse_holidays(2025)
+    assert date(2025, 4, 18) in holidays    # 耶稣受难日
+    assert date(2025, 7, 4) in holidays
+    assert date(2025, 11, 27) in holidays
+    # 2022 年元旦是周六，前一年 12 月 31 日照常交易
+    assert is_trading_day(date(2021, 12, 31))
+
+
+def test_expected_latest_bar_waits_for_close():
+    before_close = datetime(2025, 7, 7, 15, 0, tzinfo=EXCHANGE_TZ)
+    after_close = datetime(2025, 7, 7, 17, 0, tzinfo=EXCHANGE_TZ)
+    # 7/4 休市，周一收盘前最新可用的是 7/3
+    assert expected_latest_bar(before_close) == date(2025, 7, 3)
+    assert expected_latest_bar(after_close) == date(2025, 7, 7)
+
+
+def test_plan_crawl_orders_priority_and_skips_fresh(db_path, insert_prices):
+    insert_prices([('AAA', '2025-07-07', 1.0), ('BBB', '2025-07-03', 1.0)])
+    now = datetime(2025, 7, 7, 17, 0, tzinfo=EXCHANGE_TZ)
+
+    assert plan_crawl(['CCC', 'AAA', 'BBB', 'CCC', 'DDD'], db_path, ['DDD'], now) == ['DDD', 'CCC', 'BBB']
+
+
+def test_plan_crawl_skips_tickers_attempted_for_current_bar(db_path):
+    connection = sqlite3.connect(db_path)
+    record_crawl_attempts(
+        connection, [('GONE', 'no_data'), ('LAGGING', 'ok'), ('FLAKY', 'failed')], '2025-07-03'
+    )
+    connection.close()
+
+    # 同一预期交易日内不再重复抓取已确认的股票，抓取出错的股票仍然过期，需要重试
+    monday_morning = datetime(2025, 7, 7, 10, 0, tzinfo=EXCHANGE_TZ)
+    assert plan_crawl(['GONE', 'LAGGING', 'FLAKY', 'NEW'], db_path, now=monday_morning) == ['FLAKY', 'NEW']
+    # 下一个交易日的数据可用后全部重新尝试
+    monday_evening = datetime(2025, 7, 7, 17, 0, tzinfo=EXCHANGE_TZ)
+    assert plan_crawl(['GONE', 'LAGGING', 'FLAKY', 'NEW'], db_path, now=monday_evening) == [
+        'GONE', 'LAGGING', 'FLAKY', 'NEW'
+    ]